@@ -0,0 +1,34 @@
+# Loaded with `gunicorn poc.wsgi -c gunicorn.conf.py` (see Procfile)
+import os
+import shutil
+import tempfile
+
+# Import the app, and so load and warm the model, in the master before forking.
+# The model bundle is memory-mapped, so every worker reads the same physical pages.
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# Every worker writes its metrics to files in this directory so /metrics reports the whole dyno,
+# whichever worker answers the scrape. It has to be set before prometheus_client is imported.
+metrics_dir = os.environ.setdefault('prometheus_multiproc_dir', os.path.join(tempfile.gettempdir(), 'quiz-metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+def pre_fork(server, worker):
+    # database connections opened while preloading must not be shared with the workers
+    from django.db import connections
+    connections.close_all()
+
+def post_worker_init(worker):
+    from poc.quiz.memory_report import get_memory_report
+    report = get_memory_report()
+    if report:
+        worker.log.info("Worker %s memory: rss %d kB, shared %d kB, private %d kB (model bundles: rss %d kB, shared %d kB)",
+            report['pid'], report['rss_bytes']//1024, report['shared_bytes']//1024, report['private_bytes']//1024,
+            report['model_bundles']['rss_bytes']//1024, report['model_bundles']['shared_bytes']//1024)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1 @@
+default_app_config = 'poc.quiz.apps.QuizConfig'
@@ -1,2 +1,11 @@
 MODEL_NAME = 'nb_le_f0_d0_b0_c36_v0'
 # nb_ohe_f0_d0_b7_c36_v0
+
+# Share of responses served by other models, MODEL_NAME serves the rest
+# e.g. {'nb_ohe_f0_d0_b7_c36_v0': 0.1}
+MODEL_TRAFFIC_SPLIT = {}
+
+# Models also scored on every response in the background, only to compare them with the served model
+# e.g. ['nb_ohe_f0_d0_b7_c36_v0']
+SHADOW_MODELS = []
+SHADOW_WORKERS = 2
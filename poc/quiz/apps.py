@@ -1,4 +1,24 @@
+import logging
+import time
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 class QuizConfig(AppConfig):
-    name = 'quiz'
+    name = 'poc.quiz'
+    label = 'quiz'
+
+    def ready(self):
+        # importing the views up front loads every serving module before the first request
+        start = time.monotonic()
+        from . import views
+        from . content import connect_content_signals
+        from . warmup import WARMUP_STATE, warm_up_model
+        WARMUP_STATE.import_seconds = round(time.monotonic() - start,4)
+        logger.info("Serving modules imported in %ss", WARMUP_STATE.import_seconds)
+
+        connect_content_signals()
+        if settings.MODEL_WARMUP:
+            warm_up_model()
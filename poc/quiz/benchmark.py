@@ -0,0 +1,74 @@
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+# imported by the management commands and by build_model.py, so it only depends on numpy
+
+
+def summarize_latencies(seconds,wall_seconds=None):
+    latencies = np.asarray(seconds,dtype=np.float64)*1000
+    summary = {
+        'requests':len(latencies),
+        'mean_ms':float(latencies.mean()) if len(latencies) else None,
+        'p50_ms':float(np.percentile(latencies,50)) if len(latencies) else None,
+        'p95_ms':float(np.percentile(latencies,95)) if len(latencies) else None,
+        'p99_ms':float(np.percentile(latencies,99)) if len(latencies) else None,
+        'max_ms':float(latencies.max()) if len(latencies) else None
+    }
+    if wall_seconds:
+        summary['throughput'] = len(latencies)/wall_seconds
+    return summary
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git','rev-parse','--short','HEAD'],stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+def get_run_info():
+    return {
+        'commit':get_git_commit(),
+        'created':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':platform.python_version(),
+        'numpy':np.__version__,
+        'cpus':os.cpu_count()
+    }
+
+def write_results(path,results):
+    with open(path,'w') as f:
+        json.dump(results,f,indent=2,sort_keys=True)
+
+def read_results(path):
+    with open(path,'r') as f:
+        return json.load(f)
+
+def compare_to_baseline(runs,baseline_runs,key_fields,lower_is_better,higher_is_better=(),tolerance=0.2):
+    '''
+    Matches the runs of two results files on key_fields and lists every
+    metric that got worse by more than tolerance: lower_is_better metrics
+    (latencies, seconds, bytes) that grew, higher_is_better ones (throughput)
+    that shrank. Runs missing from either file are not compared.
+    '''
+    def get_key(run):
+        return tuple(run.get(field) for field in key_fields)
+    baseline = {get_key(run):run for run in baseline_runs}
+    regressions = []
+    for run in runs:
+        previous = baseline.get(get_key(run))
+        if previous is None:
+            continue
+        for metric in lower_is_better:
+            if run.get(metric) is not None and previous.get(metric) and run[metric] > previous[metric]*(1+tolerance):
+                regressions.append((get_key(run),metric,previous[metric],run[metric]))
+        for metric in higher_is_better:
+            if run.get(metric) is not None and previous.get(metric) and run[metric] < previous[metric]*(1-tolerance):
+                regressions.append((get_key(run),metric,previous[metric],run[metric]))
+    return regressions
+
+def format_regression(regression):
+    key, metric, previous, current = regression
+    return '/'.join(str(part) for part in key)+' '+metric+': '+str(round(previous,4))+' -> '+str(round(current,4))
@@ -0,0 +1,145 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from build_model import *
+from benchmark import *
+
+# Run from the repository root: python poc/quiz/benchmark_training.py --scales 1,10
+TRAINING_CSV = 'poc/quiz/exported_model_files/d0.csv'
+TEST_CSV = 'poc/quiz/exported_model_files/t7.csv'
+SCALES = '1,10,100,1000'
+
+
+class StageTimer:
+    '''
+    Runs the stages of the training pipeline one after the other and records
+    the wall time of each and, with trace_memory, the peak memory allocated
+    while it ran. tracemalloc is restarted for every stage so each peak is its
+    own; tracing also slows the stages down, so compare times taken the same way.
+    '''
+    def __init__(self,trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    def run(self,stage,function,*args,**kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = function(*args,**kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            peak_bytes = None
+            if self.trace_memory:
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        self.stages.append({'stage':stage,'seconds':seconds,'peak_bytes':peak_bytes})
+        print("  "+stage+": "+str(round(seconds,3))+"s"+
+              ("" if peak_bytes is None else ", peak "+str(round(peak_bytes/1048576.0,1))+" MB"))
+        return result
+
+
+def write_scaled_csv(path,scale,out_path,seed=0):
+    # a synthetic export with scale times the responses, drawn with replacement from the real ones
+    raw = pd.read_csv(path,dtype=str)
+    if scale != 1:
+        raw = raw.sample(n=len(raw)*scale,replace=True,random_state=seed).reset_index(drop=True)
+    raw.to_csv(out_path,index=False)
+    return len(raw)
+
+def scale_balance(balance,scale):
+    if balance == False:
+        return False
+    return {program:count*scale for program, count in balance.items()}
+
+def benchmark_pipeline(train_csv,test_csv,scale,timer):
+    # the stages of build_model.py, with the encoded dictionaries written under the name 'benchmark'
+    balance = scale_balance(data_balance,scale)
+    clean = timer.run('clean',get_clean_data,train_csv,'H',use_cache=False)
+    # the first build of an export fills the dataset cache, every later one reads it
+    timer.run('cache_miss',get_clean_data,train_csv,'H')
+    timer.run('cache_hit',get_clean_data,train_csv,'H')
+    if balance != False:
+        timer.run('balance',balance_data,clean,balance)
+    timer.run('label_encode',get_label_encoded_data,train_csv,'benchmark',list(column_list),'H',balance)
+    data = timer.run('merged_encode',get_merged_encoded_data,train_csv,'benchmark',ohe,list(column_list),'H',balance)
+
+    X = np.array(data.drop(axis=1,columns=["program"]))
+    Y = np.array(data["program"])
+    model = timer.run('fit',fit_model,MODEL_TYPE,X,Y)
+
+    test_data = get_merged_encoded_data(test_csv,'t7',ohe,list(column_list),'H',False)
+    # answers the synthetic test set happens not to contain are columns of zeros
+    test_data = test_data.reindex(columns=data.columns,fill_value=0)
+    test_array = np.array(test_data.drop(axis=1,columns=["program"]))
+    test_actual = np.array(test_data["program"])
+    timer.run('score',score_model,'benchmark',model,test_array,test_actual)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times each stage of the training pipeline on the real survey '
+                                                 'exports and on synthetic ones scaled up from them.')
+    parser.add_argument('--scales',default=SCALES,help='Comma separated multiples of the real data, 1 is the real data')
+    parser.add_argument('--train',default=TRAINING_CSV)
+    parser.add_argument('--test',default=TEST_CSV)
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--no-memory',action='store_true',help='Do not trace memory, times are closer to an untraced build')
+    parser.add_argument('--output',default='benchmark_training.json')
+    parser.add_argument('--baseline',help='Earlier results to compare with, exits with status 1 on a regression')
+    parser.add_argument('--tolerance',type=float,default=0.2)
+    args = parser.parse_args(argv)
+
+    train_csv = os.path.abspath(args.train)
+    test_csv = os.path.abspath(args.test)
+    output = os.path.abspath(args.output)
+    cwd = os.getcwd()
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # build_model.py writes its encoded dictionaries to poc/quiz/exported_model_files/, keep them out of the tree
+        os.makedirs(os.path.join(workdir,'poc','quiz','exported_model_files'))
+        os.chdir(workdir)
+        try:
+            for scale in [int(value) for value in args.scales.split(',')]:
+                train_path = train_csv
+                test_path = test_csv
+                if scale != 1:
+                    train_path = os.path.join(workdir,'train_'+str(scale)+'.csv')
+                    test_path = os.path.join(workdir,'test_'+str(scale)+'.csv')
+                    write_scaled_csv(train_csv,scale,train_path,args.seed)
+                    write_scaled_csv(test_csv,scale,test_path,args.seed)
+                rows = len(pd.read_csv(train_path,dtype=str,usecols=[0]))
+                print("Scale "+str(scale)+" ("+str(rows)+" responses)")
+                timer = StageTimer(trace_memory=not args.no_memory)
+                benchmark_pipeline(train_path,test_path,scale,timer)
+                for stage in timer.stages:
+                    stage.update({'dataset':'real' if scale == 1 else 'synthetic','scale':scale,'rows':rows})
+                    runs.append(stage)
+        finally:
+            os.chdir(cwd)
+
+    results = get_run_info()
+    results['model_type'] = MODEL_TYPE
+    results['trace_memory'] = not args.no_memory
+    results['runs'] = runs
+    write_results(output,results)
+    print("Results written to "+output)
+
+    if args.baseline:
+        regressions = compare_to_baseline(runs,read_results(args.baseline)['runs'],('scale','stage'),
+                                          ('seconds','peak_bytes'),tolerance=args.tolerance)
+        if regressions:
+            print("Slower than "+args.baseline+":")
+            for regression in regressions:
+                print("  "+format_regression(regression))
+            return 1
+        print("No regression against "+args.baseline)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
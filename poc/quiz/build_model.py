@@ -1,5 +1,3 @@
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import figure
 import numpy as np
 import pandas as pd
 import pickle
@@ -12,18 +10,22 @@ from datetime import datetime
 import json
 import pickle
 import numpy as np
+import os
 import sys
 import itertools
 import json
 import numpy as np
 import pandas as pd
 import pickle
-from statistics import mean
 from sklearn import metrics, tree, svm, preprocessing
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import KFold,cross_val_score,train_test_split,LeaveOneOut
+from sklearn.model_selection import KFold,cross_val_score,cross_val_predict,train_test_split,LeaveOneOut
 from sklearn.naive_bayes import MultinomialNB
 
+from scoring import *
+from bundle import *
+from dataset_cache import *
+
 # Changing questions into column headers for readability
 READ_HEADERS = {
                 'What Engineering program are you in?':'program',
@@ -200,6 +202,31 @@ READ_ESSAY = {
             'A bit apprehensive. I get overwhelmed with so many options.':'partial'
             }
 
+# the answers every cleaned column can hold, their sorted order is the column's label codes
+COLUMN_ANSWERS = {
+            'program':READ_PROGRAMS,
+            'problem_type':READ_PROBLEMS,
+            'creative':READ_CREATIVE,
+            'outdoors':READ_OUTDOORS,
+            'career':READ_CAREERS,
+            'group_work':READ_GROUPWORK,
+            'liked_courses':READ_COURSES,
+            'disliked_courses':READ_COURSES,
+            'programming':READ_PROGRAMMING,
+            'join_clubs':READ_CLUBS,
+            'not_clubs':READ_CLUBS,
+            'liked_projects':READ_PROJECTS,
+            'disliked_projects':READ_PROJECTS,
+            'tv_shows':READ_TV,
+            'alternate_degree':READ_ALTERNATE_DEGREE,
+            'expensive_equipment':READ_EQUIPMENT,
+            'drawing':READ_DRAWING,
+            'essay':READ_ESSAY
+            }
+# questions the survey let respondents skip, a skipped answer is the answer 'nan'
+SKIPPABLE_COLUMNS = ['join_clubs','not_clubs']
+INDUSTRY_ANSWERS = ['0','1']
+
 INDEX_PROGRAM = {
                 'mech': 9,
                 'bmed': 2,
@@ -247,7 +274,49 @@ class NpEncoder(json.JSONEncoder):
         else:
             return super(NpEncoder, self).default(obj)
 
-def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False):
+def get_answer_categories(col):
+    # the fixed categories of a cleaned column, sorted so the codes are the ones LabelEncoder gave
+    if col in READ_INDUSTRY.values():
+        return INDUSTRY_ANSWERS
+    categories = set(COLUMN_ANSWERS[col].values())
+    if col in SKIPPABLE_COLUMNS:
+        categories.add('nan')
+    return sorted(categories)
+
+def read_answers(raw,col):
+    # maps the survey texts of a column to its categories in one take, texts the question does not offer are missing
+    answers = COLUMN_ANSWERS[col]
+    categories = get_answer_categories(col)
+    texts = list(answers)
+    missing = categories.index('nan') if 'nan' in categories else -1
+    lookup = np.array([categories.index(answers[text]) for text in texts]+[missing],dtype=np.int8)
+    return pd.Categorical.from_codes(lookup[pd.Categorical(raw,categories=texts).codes],categories=categories)
+
+def get_industry_flags(industry):
+    # one '0'/'1' categorical column per industry in READ_INDUSTRY, from the ';' separated multi-select answers
+    flags = industry.str.get_dummies(sep=';').rename(columns=READ_INDUSTRY)
+    columns = list(READ_INDUSTRY.values())
+    flags = (flags.reindex(columns=columns,fill_value=0).values > 0).astype(np.int8)
+    return pd.DataFrame({col:pd.Categorical.from_codes(flags[:,i],categories=INDUSTRY_ANSWERS) for i, col in enumerate(columns)},
+                        index=industry.index,columns=columns)
+
+def get_cleaning_params(drop_not_happy,drop_gender,data_balance):
+    # everything the cleaned data depends on besides the export, part of its dataset cache key
+    return {'drop_not_happy':drop_not_happy,'drop_gender':drop_gender,'data_balance':data_balance,'balance_seed':balance_seed,
+            'headers':READ_HEADERS,'answers':COLUMN_ANSWERS,'skippable':SKIPPABLE_COLUMNS,'industry':READ_INDUSTRY}
+
+def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False,use_cache=True):
+    # an export is cleaned once per set of arguments, later calls read it back from DATASET_CACHE
+    if not use_cache:
+        return clean_data(directory,drop_not_happy,drop_gender,data_balance)
+    key = get_dataset_key('build_model',directory,get_cleaning_params(drop_not_happy,drop_gender,data_balance))
+    data = DATASET_CACHE.load(key)
+    if data is None:
+        data = clean_data(directory,drop_not_happy,drop_gender,data_balance)
+        DATASET_CACHE.save(key,data)
+    return data
+
+def clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False):
     '''
     Should we drop "Are you happy with your program?"
     '''
@@ -258,24 +327,8 @@ def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=Fa
 
     # renaming data for readability
     data = data.rename(index=str,columns = READ_HEADERS)
-    data.program = data.program.map(READ_PROGRAMS)
-    data.problem_type = data.problem_type.map(READ_PROBLEMS)
-    data.creative = data.creative.map(READ_CREATIVE)
-    data.outdoors = data.outdoors.map(READ_OUTDOORS)
-    data.career = data.career.map(READ_CAREERS)
-    data.group_work = data.group_work.map(READ_GROUPWORK)
-    data.liked_courses = data.liked_courses.map(READ_COURSES)
-    data.disliked_courses = data.disliked_courses.map(READ_COURSES)
-    data.programming = data.programming.map(READ_PROGRAMMING)
-    data.join_clubs = data.join_clubs.map(READ_CLUBS)
-    data.not_clubs = data.not_clubs.map(READ_CLUBS)
-    data.liked_projects = data.liked_projects.map(READ_PROJECTS)
-    data.disliked_projects = data.disliked_projects.map(READ_PROJECTS)
-    data.tv_shows = data.tv_shows.map(READ_TV)
-    data.alternate_degree = data.alternate_degree.map(READ_ALTERNATE_DEGREE)
-    data.expensive_equipment = data.expensive_equipment.map(READ_EQUIPMENT)
-    data.drawing = data.drawing.map(READ_DRAWING)
-    data.essay = data.essay.map(READ_ESSAY)
+    for col in COLUMN_ANSWERS:
+        data[col] = read_answers(data[col],col)
     try:
         data.new_programming = data.new_programming.map(READ_NEW_PROGRAMMING)
     except:
@@ -283,26 +336,9 @@ def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=Fa
 
     # Cleaning industry data
     data.index.name = 'id'
-    industry_data = data["industry"].str.split(";", expand = True)
-    industry_data = industry_data.replace(READ_INDUSTRY)
-    binary_industry_data = np.array([np.arange(len(data))]*8).T
-    binary_industry_data = pd.DataFrame(binary_industry_data, columns=READ_INDUSTRY.values())
-    binary_industry_data.index.name = 'id'
-
-    for col in binary_industry_data.columns:
-        binary_industry_data[col].values[:] = '0'
-
-    for index, row in industry_data.iterrows():
-        for i in range(8):
-            try:
-                binary_industry_data.iloc[int(index), binary_industry_data.columns.get_loc(row[i])] = '1'
-            except:
-                error = "None_Type detected"
-
     data.index = data.index.map(int)
-    binary_industry_data.index = binary_industry_data.index.map(int)
-    data = (data.merge(binary_industry_data, left_on='id', right_on='id',how='left'))
-    data = data.drop(['industry'], axis=1)
+    industry_data = get_industry_flags(data["industry"])
+    data = pd.concat([data.drop(['industry'], axis=1),industry_data],axis=1)
 
     # if drop where all values are unhapppy
     if drop_not_happy == 'H':
@@ -319,22 +355,28 @@ def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=Fa
     # data = data.sample(frac=1).reset_index(drop=True) ##Shuffle
 
     if data_balance != False:
-        programs = list(READ_PROGRAMS.values())
-        b_df = data.copy()
-        b_df = b_df.head(0)
-
-        for program in programs:
-            temp_df = data.copy()[data.program==program]
-            while len(temp_df) <= data_balance[program]:
-                temp_df = temp_df.append(temp_df)
-            temp_df = temp_df.head(data_balance[program])
-            b_df = b_df.append(temp_df)
-            b_df = b_df.reset_index(drop=True)
-        data = b_df
+        data = balance_data(data,data_balance,balance_seed)
 
     data.columns = data.columns.astype(str)
     return data
 
+def balance_data(data,data_balance,seed=None):
+    # repeats (or cuts) the rows of every program to the number of rows data_balance asks for, in one take
+    # of the row positions: each program's rows are cycled in order, or in a shuffled order fixed by seed
+    programs = list(READ_PROGRAMS.values())
+    program_rows = data.program.values
+    rng = np.random.RandomState(seed) if seed is not None else None
+    positions = []
+    for program in programs:
+        rows = np.flatnonzero(program_rows == program)
+        if len(rows) == 0:
+            print("No responses for "+program+", it is left out of the balanced data")
+            continue
+        if rng is not None:
+            rows = rng.permutation(rows)
+        positions.append(np.resize(rows,data_balance[program]))
+    return data.iloc[np.concatenate(positions)].reset_index(drop=True)
+
 def transform_post_dict(post_dict):
     print("Transforming post_dict...")
     post_dict = json.dumps(dict(post_dict))
@@ -353,6 +395,15 @@ def transform_post_dict(post_dict):
         post_dict[industry] = '1'
     return dict(post_dict)
 
+def get_label_codes(series):
+    # codes and categories of a cleaned column, a column left as text (gender) is numbered the way LabelEncoder did
+    if str(series.dtype) != 'category':
+        series = series.astype(str).astype('category')
+    return series.cat.codes.values, list(series.cat.categories)
+
+def get_encoded_dict_path(model_name):
+    return 'poc/quiz/exported_model_files/'+model_name+'_encoded_dictionary.json'
+
 def get_label_encoded_data(directory,model_name,column_list,drop_not_happy='H',data_balance=False,drop_gender=True):
     df = get_clean_data(directory,drop_not_happy,data_balance=data_balance,drop_gender=drop_gender)
     if drop_gender:
@@ -362,19 +413,16 @@ def get_label_encoded_data(directory,model_name,column_list,drop_not_happy='H',d
         df = df[column_list]
 
     col_list = list(df.columns)
-    encoded_dict_list = []
-    for col in col_list:
-        keys = df[col].unique()
-        le = preprocessing.LabelEncoder()
-        le.fit(list(keys))
-        df[col] = le.transform(list(df[col]))
-        vals = df[col].unique()
-        keys = list(le.inverse_transform(vals))
-        cd = dict(zip(keys,vals))
-        row = {str(col):cd}
-        encoded_dict_list.append(row)
-        with open('poc/quiz/exported_model_files/'+model_name+'_'+col+'_encoded_dictionary.json', 'w') as f:
-            json.dump(str(row),f,cls=NpEncoder)
+    # the cleaned columns are categorical, their codes are the label encoding
+    codes = np.empty((len(df),len(col_list)),dtype=np.int8)
+    encoded_dict = {}
+    for i, col in enumerate(col_list):
+        codes[:,i], categories = get_label_codes(df[col])
+        encoded_dict[col] = {col:{answer:code for code, answer in enumerate(categories)}}
+    df = pd.DataFrame(codes,index=df.index,columns=col_list)
+    encoded_dict_list = [encoded_dict[col] for col in col_list]
+    with open(get_encoded_dict_path(model_name), 'w') as f:
+        json.dump(encoded_dict,f)
 
     with open('poc/quiz/exported_model_files/'+model_name+'_cols.txt', 'w') as f:
         for col in col_list:
@@ -418,6 +466,11 @@ def get_encoded_dict(model_name):
             currentPlace = line[:-1]
             # add item to the list
             cols.append(currentPlace)
+    if os.path.exists(get_encoded_dict_path(model_name)):
+        with open(get_encoded_dict_path(model_name), 'r') as f:
+            encoded_dict = json.load(f)
+        return {col:encoded_dict[col] for col in cols}
+    # models exported before the combined dictionary have one file per column
     encoded_dict = {}
     for col in cols:
         with open('poc/quiz/exported_model_files/'+model_name+'_'+col+'_encoded_dictionary.json', 'r') as f:
@@ -436,18 +489,64 @@ def save_model(df,model,cat,model_name):
         pickle.dump(model, fid,2)
     with open('poc/quiz/exported_model_files/'+model_name+'_cat', 'wb') as fid:
         pickle.dump(cat, fid,2)
+    # parameters used by the web workers to score without sklearn
+    export_kernel(model,'poc/quiz/exported_model_files/',model_name)
+
+def export_model_bundle(model_name,metrics=None):
+    # packs the exported artifacts of a model into the single file the web workers load
+    directory = 'poc/quiz/exported_model_files/'
+    cols = []
+    with open(directory+model_name+'_cols.txt', 'r') as f:
+        for line in f:
+            cols.append(line[:-1])
+    with open(directory+model_name+'_cat', 'rb') as f:
+        index_dict = pickle.load(f)
+    kernel = load_kernel(find_kernel_path(directory,model_name))
+    return write_bundle(get_bundle_path(directory,model_name),model_name,cols,index_dict,get_encoded_dict(model_name),kernel,metrics)
 
 def retrieve_prediction_labels(model,prediction):
     # returns a dictionary for each label and their probability in the prediction
-    labels = model.classes_
-    results = prediction[0]
-    results_dict = {}
-    for i in range(len(results)):
-        results_dict[INV_INDEX_PROGRAM[labels[i]]] = np.round(results[i],4)
-    return results_dict
+    labels = [INV_INDEX_PROGRAM[label] for label in model.classes_]
+    results = np.round(prediction[0],4)
+    return dict(zip(labels,results.tolist()))
+
+def get_estimator(model_type):
+    # 'nb', 'lr' or 'dt', the first part of the model name; each has a scoring backend in scoring.py
+    if model_type == 'lr':
+        return LogisticRegression(solver='liblinear',multi_class='ovr')
+    if model_type == 'dt':
+        return tree.DecisionTreeClassifier(random_state=0)
+    return MultinomialNB()
+
+def learn_ensemble_weights(probas,actual_index,step=0.05):
+    # probas is (members, rows, classes); tries every weighting on a grid over the simplex at once
+    # and keeps the one with the highest mean log likelihood of the actual program
+    n_members = probas.shape[0]
+    grid = np.arange(0,1+step/2,step)
+    weights = np.array([w for w in itertools.product(grid,repeat=n_members) if abs(sum(w)-1) < step/2])
+    actual = probas[:,np.arange(probas.shape[1]),actual_index]
+    log_likelihood = np.log(np.clip(np.dot(weights,actual),1e-6,None)).mean(axis=1)
+    return np.round(weights[np.argmax(log_likelihood)],6)
+
+def fit_model(model_type,X,Y):
+    if model_type != 'ens':
+        return get_estimator(model_type).fit(X, Y)
+    # blend weights come from each member's out of fold probabilities, then the members are refit on all the data
+    probas = []
+    members = []
+    for member_type in ENSEMBLE_MEMBERS:
+        probas.append(cross_val_predict(get_estimator(member_type),X,Y,cv=5,method='predict_proba'))
+        members.append(kernel_from_model(get_estimator(member_type).fit(X, Y)))
+    classes = members[0].classes_
+    weights = learn_ensemble_weights(np.array(probas),np.searchsorted(classes,Y))
+    print("Ensemble weights: "+str(dict(zip(ENSEMBLE_MEMBERS,weights.tolist()))))
+    return EnsembleKernel(members,weights,classes)
 
 # Define Parameters
 MODEL_NAME = 'nb_ohe_f0_d0_b7_c36_v0'
+MODEL_TYPE = MODEL_NAME.split('_')[0]
+# Model types blended when MODEL_TYPE is 'ens'
+ENSEMBLE_MEMBERS = ['nb','lr']
 
 d0 = 'poc/quiz/exported_model_files/d0.csv'
 
@@ -539,62 +638,25 @@ experiment_model_name = 'd0_b7_c36_v0'
 directory = d0
 data_balance = b7
 column_list = c36
+balance_seed = None # None repeats each program's rows in survey order, a number shuffles them first (same seed, same data)
 data_balance_multiple = v0 # Ratio of other programs to program in binary classifier. 2 means double of other programs, 0.5 means half
+DATASET_CACHE = DatasetCache() # cleaned exports under poc/quiz/dataset_cache/, DatasetCache(max_entries=0) keeps none
 
 def save_scores(scoring_dictionary,experiment_model_name):
     df = pd.DataFrame(scoring_dictionary)
     df = df.T
     df.to_csv("exported_model_files/scores/"+experiment_model_name+".csv", header=True)
 
-def get_mclass_accuracy(temp_model_name,model,test_array,test_actual):
-    test_pred = []
-    for i in range(len(test_array)):
-        test_pred.append(model.predict([test_array[i]]))
-    accuracy = metrics.accuracy_score(test_pred,test_actual)
-    return accuracy
-
-def sort_probability_dict(p_df):
-    ordered_probabilties = sorted(p_df.values(),reverse=True)
-    ordered_programs = sorted(p_df, key=p_df.get,reverse=True)
-    return [p_df, ordered_probabilties, ordered_programs]
-
-def get_mclass_t3(temp_model_name,model,test_array,test_actual):
-    t3_scores = []
-    for i in range(len(test_array)):
-        prediction = model.predict_proba([test_array[i]])
-        probs = sort_probability_dict(retrieve_prediction_labels(model,prediction))[2][:3]
-        n_probs = []
-        for prob in probs:
-            n_probs.append(INDEX_PROGRAM[prob])
-        try:
-            t3 = (1/(n_probs.index(test_actual[i])+1))
-        except:
-            t3 = 0
-        t3_scores.append(t3)
-
-    return mean(t3_scores)
-
-def get_mclass_rr(temp_model_name,model,test_array,test_actual):
-    rr_scores = []
-    for i in range(len(test_array)):
-        prediction = model.predict_proba([test_array[i]])
-        probs = sort_probability_dict(retrieve_prediction_labels(model,prediction))[2]
-        n_probs = []
-        for prob in probs:
-            n_probs.append(INDEX_PROGRAM[prob])
-        try:
-            rr = (1/(n_probs.index(test_actual[i])+1))
-        except:
-            rr = 0
-        rr_scores.append(rr)
-    return mean(rr_scores)
-
 # Supporting Functions for RE-Building the model on the Heroku Server
-print("building model...")
-if 'le' in MODEL_NAME:
-    # Building New model
-    model_name = 'nb_le_f0_'+ experiment_model_name
-    data = get_label_encoded_data(directory,model_name,column_list,'H',data_balance=data_balance)[0]
+def build_model():
+    print("building model...")
+    if 'le' in MODEL_NAME:
+        # Building New model
+        model_name = MODEL_TYPE+'_le_f0_'+ experiment_model_name
+        data = get_label_encoded_data(directory,model_name,column_list,'H',data_balance=data_balance)[0]
+    elif 'ohe' in MODEL_NAME:
+        model_name = MODEL_TYPE+'_ohe_f0_'+ experiment_model_name
+        data = get_merged_encoded_data(directory,model_name,one_hot_encode=ohe,column_list = column_list,drop_not_happy='H',data_balance=data_balance)
 
     x_df = data.drop(axis=1,columns=["program"])
     y_df = data["program"]
@@ -602,61 +664,48 @@ if 'le' in MODEL_NAME:
     X = np.array(x_df) # convert dataframe into np array
     Y = np.array(y_df) # convert dataframe into np array
 
-    mnb = MultinomialNB()
-    model = mnb.fit(X, Y) # fit the model using training data
+    model = fit_model(MODEL_TYPE,X,Y) # fit the model using training data
 
     cat = data.drop('program',axis=1)
     cat = dict(zip(cat.columns,range(cat.shape[1])))
 
-elif 'ohe' in MODEL_NAME:
-    model_name = 'nb_ohe_f0_'+ experiment_model_name
-    data = get_merged_encoded_data(directory,model_name,one_hot_encode=ohe,column_list = column_list,drop_not_happy='H',data_balance=data_balance)
-
-    x_df = data.drop(axis=1,columns=["program"])
-    y_df = data["program"]
-
-    X = np.array(x_df) # convert dataframe into np array
-    Y = np.array(y_df) # convert dataframe into np array
-
-    mnb = MultinomialNB()
-    model = mnb.fit(X, Y) # fit the model using training data
-
-    cat = data.drop('program',axis=1)
-    cat = dict(zip(cat.columns,range(cat.shape[1])))
-
-save_model(data,model,cat,model_name)
-
-# Scoring models
-print("Scoring model")
-model_name = model_name
-temp_model_name = model_name
-
-model_data = pd.read_csv('poc/quiz/exported_model_files/'+model_name+'.csv',dtype=str)
-# Loading test data
-if 'le' in model_name:
-    test_data_t7 = get_label_encoded_data('poc/quiz/exported_model_files/t7.csv',model_name='t7',column_list=column_list,drop_not_happy='H',data_balance=False)[0]
-elif 'ohe' in model_name:
-    test_data_t7 = get_merged_encoded_data(directory = 'poc/quiz/exported_model_files/t7.csv',model_name ='t7',one_hot_encode=ohe,column_list = column_list,drop_not_happy='H',data_balance=False)
-
-test_data_t7_temp = test_data_t7.copy()[list(model_data.columns)].head(210)
-
-# Loading model files
-pkl_file = open('poc/quiz/exported_model_files/'+model_name+'_cat', 'rb')
-index_dict = pickle.load(pkl_file)
-new_vector = np.zeros(len(index_dict))
-
-pkl_file = open('poc/quiz/exported_model_files/'+model_name+'.pkl', 'rb')
-model = pickle.load(pkl_file)
-
-# Preparing Loading data
-test_array = np.array(test_data_t7_temp.drop(axis=1,columns=["program"]))
-test_actual = np.array(test_data_t7_temp["program"])
-
-mclass_t3 = get_mclass_t3(temp_model_name,model,test_array,test_actual)
-mclass_RR = get_mclass_rr(temp_model_name,model,test_array,test_actual)
-mclass_accuracy = get_mclass_accuracy(temp_model_name,model,test_array,test_actual)
-
-print("Model:  "+model_name)
-print("t3:  "+str(mclass_t3))
-print("RR:  "+str(mclass_RR))
-print("Accuracy:  "+str(mclass_accuracy))
+    save_model(data,model,cat,model_name)
+    return model_name
+
+def get_test_data(model_name,test_directory='poc/quiz/exported_model_files/t7.csv'):
+    # the test responses, encoded like the model's training data
+    model_data = pd.read_csv('poc/quiz/exported_model_files/'+model_name+'.csv',dtype=str)
+    if 'le' in model_name:
+        test_data_t7 = get_label_encoded_data(test_directory,model_name='t7',column_list=column_list,drop_not_happy='H',data_balance=False)[0]
+    elif 'ohe' in model_name:
+        test_data_t7 = get_merged_encoded_data(directory = test_directory,model_name ='t7',one_hot_encode=ohe,column_list = column_list,drop_not_happy='H',data_balance=False)
+
+    test_data_t7_temp = test_data_t7.copy()[list(model_data.columns)].head(210)
+    test_array = np.array(test_data_t7_temp.drop(axis=1,columns=["program"]))
+    test_actual = np.array(test_data_t7_temp["program"])
+    return test_array, test_actual
+
+def score_model(model_name,model,test_array,test_actual):
+    # one pass over the test set for every metric
+    scores = evaluate_model(model,test_array,test_actual)
+    return {'t3':float(scores['t3']),'rr':float(scores['rr']),'accuracy':float(scores['accuracy'])}
+
+if __name__ == '__main__':
+    model_name = build_model()
+
+    # Scoring models
+    print("Scoring model")
+    test_array, test_actual = get_test_data(model_name)
+
+    # Loading model files
+    pkl_file = open('poc/quiz/exported_model_files/'+model_name+'.pkl', 'rb')
+    model = pickle.load(pkl_file)
+
+    scores = score_model(model_name,model,test_array,test_actual)
+    print("Model:  "+model_name)
+    print("t3:  "+str(scores['t3']))
+    print("RR:  "+str(scores['rr']))
+    print("Accuracy:  "+str(scores['accuracy']))
+
+    export_model_bundle(model_name,scores)
+    print("Bundle written for "+model_name)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+BUNDLE_MAGIC = b'QUIZMDL1'
+BUNDLE_FORMAT = 'quiz-model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+
+
+def get_bundle_path(directory,model_name):
+    return directory+model_name+'.bundle'
+
+def write_bundle(path,model_name,columns,index_dict,encoded_dict,kernel,metrics=None,dtype='<f8'):
+    '''
+    Layout: magic, uint32 manifest length, JSON manifest padded with spaces so
+    the data block starts on a BUNDLE_ALIGNMENT boundary, then the kernel's
+    arrays, each aligned the same way. encoded_dict is
+    {column: {column: {answer: code}}} as read from the per-column JSON files.
+    Floating point arrays are stored as dtype.
+    '''
+    blocks = []
+    specs = {}
+    offset = 0
+    for name, array in sorted(kernel.arrays().items()):
+        array = np.asarray(array)
+        if array.dtype.kind == 'f':
+            array = array.astype(dtype)
+        array = np.ascontiguousarray(array,dtype=array.dtype.newbyteorder('<'))
+        padding = -offset % BUNDLE_ALIGNMENT
+        blocks.append(b'\0'*padding)
+        offset += padding
+        specs[name] = {'offset':offset,'shape':list(array.shape),'dtype':array.dtype.str}
+        blocks.append(array.tobytes())
+        offset += array.nbytes
+    data = b''.join(blocks)
+    features = sorted(index_dict,key=index_dict.get)
+    manifest = {
+        'format':BUNDLE_FORMAT,
+        'format_version':BUNDLE_FORMAT_VERSION,
+        'model_name':model_name,
+        'backend':kernel.backend,
+        'created':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'columns':list(columns),
+        'features':features,
+        'vocabularies':{col:encoded_dict[col][col] for col in columns},
+        'classes':[int(c) for c in kernel.classes_],
+        'metrics':metrics or {},
+        'arrays':specs,
+        'data_bytes':len(data),
+        'data_sha256':hashlib.sha256(data).hexdigest()
+    }
+    header = json.dumps(manifest,sort_keys=True,separators=(',',':')).encode('utf-8')
+    prefix = len(BUNDLE_MAGIC) + 4
+    padding = -(prefix + len(header)) % BUNDLE_ALIGNMENT
+    header += b' '*padding
+    # written beside the old bundle and swapped in, workers that mapped the old file keep reading it
+    with open(path+'.tmp','wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack('<I',len(header)))
+        f.write(header)
+        f.write(data)
+    os.replace(path+'.tmp',path)
+    return manifest
+
+
+class ModelBundle:
+    '''
+    A model bundle opened once and memory-mapped read-only. The arrays are
+    views on the mapping, so nothing is copied until pages are touched and
+    every process mapping the same file shares them through the page cache.
+    '''
+    def __init__(self,path,verify=True):
+        self.path = path
+        with open(path,'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        prefix = len(BUNDLE_MAGIC) + 4
+        if self._mmap[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(path+" is not a model bundle")
+        header_length = struct.unpack('<I',self._mmap[len(BUNDLE_MAGIC):prefix])[0]
+        self.manifest = json.loads(self._mmap[prefix:prefix+header_length].decode('utf-8'))
+        if self.manifest['format_version'] > BUNDLE_FORMAT_VERSION:
+            raise ValueError(path+" uses bundle format version "+str(self.manifest['format_version']))
+        self.data_offset = prefix + header_length
+        if verify:
+            self.verify()
+        self.arrays = {}
+        for name, spec in self.manifest['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            array = np.frombuffer(self._mmap,dtype=dtype,count=count,offset=self.data_offset+spec['offset'])
+            self.arrays[name] = array.reshape(spec['shape'])
+
+    def verify(self):
+        end = self.data_offset + self.manifest['data_bytes']
+        if end > len(self._mmap):
+            raise ValueError(self.path+" is truncated")
+        digest = hashlib.sha256(memoryview(self._mmap)[self.data_offset:end]).hexdigest()
+        if digest != self.manifest['data_sha256']:
+            raise ValueError(self.path+" failed its checksum")
+
+    @property
+    def model_name(self):
+        return self.manifest['model_name']
+
+    @property
+    def backend(self):
+        return self.manifest['backend']
+
+    @property
+    def columns(self):
+        return self.manifest['columns']
+
+    @property
+    def index_dict(self):
+        return {feature:i for i, feature in enumerate(self.manifest['features'])}
+
+    @property
+    def encoded_dict(self):
+        # same shape as get_encoded_dict so FeatureEncoder can take either
+        return {col:{col:codes} for col, codes in self.manifest['vocabularies'].items()}
+
+    @property
+    def classes(self):
+        return np.array(self.manifest['classes'])
+
+    @property
+    def metrics(self):
+        return self.manifest['metrics']
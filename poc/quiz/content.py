@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+import uuid
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from django.utils.text import slugify
+from import_export.signals import post_import
+
+from . models import *
+
+logger = logging.getLogger(__name__)
+
+CONTENT_MODELS = (Program,Recommendation,Description,CareerType,CourseType,Career,Course,Comparison)
+CONTENT_VERSION_KEY = 'quiz:content_version'
+
+
+def get_type_key(option):
+    # 'Sample Full-Time Job' -> 'sample_full_time_job' so templates can look the group up directly
+    return slugify(option).replace('-','_')
+
+
+class ProgramContent:
+    '''
+    Everything the program pages show for one Recommendation, grouped ahead of time:
+    courses and careers are dictionaries keyed by their type (see get_type_key).
+    '''
+    def __init__(self,recommendation):
+        self.recommendation = recommendation
+        self.code = recommendation.code
+        self.program = recommendation.program
+        self.descriptions = []
+        self.courses = {}
+        self.careers = {}
+        self.comparisons = []
+
+    def freeze(self):
+        # swaps the lists and dictionaries for read-only versions once grouping is done
+        self.descriptions = tuple(self.descriptions)
+        self.courses = MappingProxyType({key:tuple(value) for key, value in self.courses.items()})
+        self.careers = MappingProxyType({key:tuple(value) for key, value in self.careers.items()})
+        self.comparisons = tuple(self.comparisons)
+        return self
+
+    def __str__(self):
+        return str(self.program.name)
+
+
+def load_program_content():
+    # returns {code: ProgramContent} for every program using one query per model
+    recommendations = Recommendation.objects.select_related('program').order_by('id')
+    by_id = {}
+    content = {}
+    for recommendation in recommendations:
+        program_content = ProgramContent(recommendation)
+        by_id[recommendation.id] = program_content
+        content[recommendation.code] = program_content
+
+    for description in Description.objects.order_by('id'):
+        if description.program_id in by_id:
+            by_id[description.program_id].descriptions.append(description)
+    for course in Course.objects.select_related('course_type').order_by('id'):
+        if course.program_id in by_id:
+            courses = by_id[course.program_id].courses
+            courses.setdefault(get_type_key(course.course_type.option),[]).append(course)
+    for career in Career.objects.select_related('career_type').order_by('id'):
+        if career.program_id in by_id:
+            careers = by_id[career.program_id].careers
+            careers.setdefault(get_type_key(career.career_type.option),[]).append(career)
+    for comparison in Comparison.objects.select_related('program_2').order_by('id'):
+        if comparison.recommendation_id in by_id:
+            by_id[comparison.recommendation_id].comparisons.append(comparison)
+    for program_content in content.values():
+        program_content.freeze()
+    return content
+
+
+class ContentSnapshot:
+    '''
+    Read-only copy of the program reference content held by one worker.
+    version is the shared content version it was built from, built_at is
+    when it was read from the database. cache_version also changes with every
+    rebuild: without a shared cache backend an edit only bumps the version in
+    the worker that saved it, and the others pick it up by rebuilding after
+    CONTENT_SNAPSHOT_MAX_AGE, so pages and fragments are keyed on cache_version.
+    '''
+    def __init__(self,programs,version):
+        self.programs = MappingProxyType(programs)
+        self.version = version
+        self.cache_version = version+'.'+uuid.uuid4().hex
+        self.built_at = timezone.now()
+        self.built_monotonic = time.monotonic()
+
+
+_snapshot = None
+_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+def get_content_version():
+    # shared through the cache so every worker using the same backend sees a change
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is None:
+        cache.add(CONTENT_VERSION_KEY,uuid.uuid4().hex,None)
+        version = cache.get(CONTENT_VERSION_KEY)
+    return version
+
+def bump_content_version():
+    cache.set(CONTENT_VERSION_KEY,uuid.uuid4().hex,None)
+
+def _is_current(snapshot,now):
+    global _checked_at
+    if snapshot is None:
+        return False
+    if now - snapshot.built_monotonic > settings.CONTENT_SNAPSHOT_MAX_AGE:
+        return False
+    if now - _checked_at < settings.CONTENT_VERSION_CHECK_INTERVAL:
+        return True
+    if get_content_version() != snapshot.version:
+        return False
+    _checked_at = now
+    return True
+
+def get_content_snapshot():
+    global _snapshot, _checked_at
+    snapshot = _snapshot
+    if _is_current(snapshot,time.monotonic()):
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is not snapshot and _snapshot is not None:
+            return _snapshot
+        version = get_content_version()
+        snapshot = ContentSnapshot(load_program_content(),version)
+        _snapshot = snapshot
+        _checked_at = time.monotonic()
+        logger.info("Program content snapshot built, version %s", version)
+        return snapshot
+
+def get_program_content():
+    return get_content_snapshot().programs
+
+def invalidate_content_snapshot(**kwargs):
+    # bumped again on commit, in case another worker rebuilt from the uncommitted state in between
+    global _snapshot
+    _snapshot = None
+    bump_content_version()
+    transaction.on_commit(bump_content_version)
+
+def handle_content_import(sender,model=None,**kwargs):
+    if model in CONTENT_MODELS:
+        invalidate_content_snapshot()
+
+def connect_content_signals():
+    for model in CONTENT_MODELS:
+        post_save.connect(invalidate_content_snapshot,sender=model,dispatch_uid='quiz_content_save_'+model.__name__)
+        post_delete.connect(invalidate_content_snapshot,sender=model,dispatch_uid='quiz_content_delete_'+model.__name__)
+    post_import.connect(handle_content_import,dispatch_uid='quiz_content_import')
@@ -1,11 +1,18 @@
 import itertools
 import json
+import logging
+import os
 import numpy as np
-import pandas as pd
 import pickle
-from sklearn import preprocessing
 
+from . bundle import *
+from . dataset_cache import *
 from . dictionaries import *
+from . scoring import *
+
+logger = logging.getLogger(__name__)
+
+DATASET_CACHE = DatasetCache()
 
 class NpEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -19,7 +26,7 @@ class NpEncoder(json.JSONEncoder):
             return super(NpEncoder, self).default(obj)
 
 def transform_post_dict(post_dict):
-    print("Transforming post_dict...")
+    logger.debug("Transforming post_dict...")
     post_dict = json.dumps(dict(post_dict))
     post_dict = json.loads(post_dict)
     post_dict = dict(post_dict)
@@ -36,7 +43,9 @@ def transform_post_dict(post_dict):
         post_dict[industry] = '1'
     return dict(post_dict)
 
+# pandas and sklearn are only needed to build models, serving never imports them
 def get_encoded_data(directory,model_name,drop_not_happy):
+    from sklearn import preprocessing
     df = get_clean_data(directory,drop_not_happy)
     df = df.drop(['happy'], axis=1)
 
@@ -70,6 +79,11 @@ def get_encoded_dict(model_name):
             currentPlace = line[:-1]
             # add item to the list
             cols.append(currentPlace)
+    if os.path.exists(get_encoded_dict_path(model_name)):
+        with open(get_encoded_dict_path(model_name), 'r') as f:
+            encoded_dict = json.load(f)
+        return {col:encoded_dict[col] for col in cols}
+    # models exported before the combined dictionary have one file per column
     encoded_dict = {}
     for col in cols:
         with open('poc/quiz/exported_model_files/'+model_name+'_'+col+'_encoded_dictionary.json', 'r') as f:
@@ -82,15 +96,31 @@ def save_model(model,cat,model_name):
         pickle.dump(model, fid,2)
     with open('poc/quiz/exported_model_files/'+model_name+'_cat', 'wb') as fid:
         pickle.dump(cat, fid,2)
+    export_kernel(model,'poc/quiz/exported_model_files/',model_name)
+    export_model_bundle(model_name)
+
+def export_model_bundle(model_name,metrics=None):
+    # packs the exported artifacts of a model into the single file the web workers load
+    directory = 'poc/quiz/exported_model_files/'
+    cols = []
+    with open(directory+model_name+'_cols.txt', 'r') as f:
+        for line in f:
+            cols.append(line[:-1])
+    with open(directory+model_name+'_cat', 'rb') as f:
+        index_dict = pickle.load(f)
+    kernel = load_kernel(find_kernel_path(directory,model_name))
+    return write_bundle(get_bundle_path(directory,model_name),model_name,cols,index_dict,get_encoded_dict(model_name),kernel,metrics)
 
 def retrieve_prediction_labels(model,prediction):
     # returns a dictionary for each label and their probability in the prediction
-    labels = model.classes_
-    results = prediction[0]
-    results_dict = {}
-    for i in range(len(results)):
-        results_dict[INV_INDEX_PROGRAM[labels[i]]] = np.round(results[i],4)
-    return results_dict
+    labels = [INV_INDEX_PROGRAM[label] for label in model.classes_]
+    results = np.round(prediction[0],4)
+    return dict(zip(labels,results.tolist()))
+
+def rank_prediction_labels(model,prediction):
+    # returns the labels ordered from the most to the least probable
+    order = rank_classes(prediction)[0]
+    return [INV_INDEX_PROGRAM[label] for label in model.classes_[order]]
 
 # Defining methods to help normaliz the data
 def normalize_3_variables(df3,x,y,column,hue):
@@ -115,6 +145,7 @@ def normalize_1_variables(df1,x,y):
     return normalized_data
 
 def heatmapify(df,one_var,list_one,two_var,list_two):
+    import pandas as pd
     return_list = []
     for one in list_one:
         new_list = []
@@ -130,10 +161,55 @@ def heatmapify(df,one_var,list_one,two_var,list_two):
     return heatmapdf
 
 
-def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False):
+def get_answer_categories(col):
+    # the fixed categories of a cleaned column, sorted so the codes are the ones LabelEncoder gave
+    if col in READ_INDUSTRY.values():
+        return INDUSTRY_ANSWERS
+    categories = set(COLUMN_ANSWERS[col].values())
+    if col in SKIPPABLE_COLUMNS:
+        categories.add('nan')
+    return sorted(categories)
+
+def read_answers(raw,col):
+    # maps the survey texts of a column to its categories in one take, texts the question does not offer are missing
+    import pandas as pd
+    answers = COLUMN_ANSWERS[col]
+    categories = get_answer_categories(col)
+    texts = list(answers)
+    missing = categories.index('nan') if 'nan' in categories else -1
+    lookup = np.array([categories.index(answers[text]) for text in texts]+[missing],dtype=np.int8)
+    return pd.Categorical.from_codes(lookup[pd.Categorical(raw,categories=texts).codes],categories=categories)
+
+def get_industry_flags(industry):
+    # one '0'/'1' categorical column per industry in READ_INDUSTRY, from the ';' separated multi-select answers
+    import pandas as pd
+    flags = industry.str.get_dummies(sep=';').rename(columns=READ_INDUSTRY)
+    columns = list(READ_INDUSTRY.values())
+    flags = (flags.reindex(columns=columns,fill_value=0).values > 0).astype(np.int8)
+    return pd.DataFrame({col:pd.Categorical.from_codes(flags[:,i],categories=INDUSTRY_ANSWERS) for i, col in enumerate(columns)},
+                        index=industry.index,columns=columns)
+
+def get_cleaning_params(drop_not_happy,drop_gender,data_balance):
+    # everything the cleaned data depends on besides the export, part of its dataset cache key
+    return {'drop_not_happy':drop_not_happy,'drop_gender':drop_gender,'data_balance':data_balance,'balance_seed':None,
+            'headers':READ_HEADERS,'answers':COLUMN_ANSWERS,'skippable':SKIPPABLE_COLUMNS,'industry':READ_INDUSTRY}
+
+def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False,use_cache=True):
+    # an export is cleaned once per set of arguments, later calls read it back from DATASET_CACHE
+    if not use_cache:
+        return clean_data(directory,drop_not_happy,drop_gender,data_balance)
+    key = get_dataset_key('data_load',directory,get_cleaning_params(drop_not_happy,drop_gender,data_balance))
+    data = DATASET_CACHE.load(key)
+    if data is None:
+        data = clean_data(directory,drop_not_happy,drop_gender,data_balance)
+        DATASET_CACHE.save(key,data)
+    return data
+
+def clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=False):
     '''
     Should we drop "Are you happy with your program?"
     '''
+    import pandas as pd
     data = pd.read_csv(directory,dtype=str)
 
     # dropping PII + skill_test + timestamp + year + raw_industry
@@ -141,47 +217,14 @@ def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=Fa
 
     # renaming data for readability
     data = data.rename(index=str,columns = READ_HEADERS)
-    data.program = data.program.map(READ_PROGRAMS)
-    data.problem_type = data.problem_type.map(READ_PROBLEMS)
-    data.creative = data.creative.map(READ_CREATIVE)
-    data.outdoors = data.outdoors.map(READ_OUTDOORS)
-    data.career = data.career.map(READ_CAREERS)
-    data.group_work = data.group_work.map(READ_GROUPWORK)
-    data.liked_courses = data.liked_courses.map(READ_COURSES)
-    data.disliked_courses = data.disliked_courses.map(READ_COURSES)
-    data.programming = data.programming.map(READ_PROGRAMMING)
-    data.join_clubs = data.join_clubs.map(READ_CLUBS)
-    data.not_clubs = data.not_clubs.map(READ_CLUBS)
-    data.liked_projects = data.liked_projects.map(READ_PROJECTS)
-    data.disliked_projects = data.disliked_projects.map(READ_PROJECTS)
-    data.tv_shows = data.tv_shows.map(READ_TV)
-    data.alternate_degree = data.alternate_degree.map(READ_ALTERNATE_DEGREE)
-    data.expensive_equipment = data.expensive_equipment.map(READ_EQUIPMENT)
-    data.drawing = data.drawing.map(READ_DRAWING)
-    data.essay = data.essay.map(READ_ESSAY)
+    for col in COLUMN_ANSWERS:
+        data[col] = read_answers(data[col],col)
 
     # Cleaning industry data
     data.index.name = 'id'
-    industry_data = data["industry"].str.split(";", expand = True)
-    industry_data = industry_data.replace(READ_INDUSTRY)
-    binary_industry_data = np.array([np.arange(len(data))]*8).T
-    binary_industry_data = pd.DataFrame(binary_industry_data, columns=READ_INDUSTRY.values())
-    binary_industry_data.index.name = 'id'
-
-    for col in binary_industry_data.columns:
-        binary_industry_data[col].values[:] = '0'
-
-    for index, row in industry_data.iterrows():
-        for i in range(8):
-            try:
-                binary_industry_data.iloc[int(index), binary_industry_data.columns.get_loc(row[i])] = '1'
-            except:
-                error = "None_Type detected"
-
     data.index = data.index.map(int)
-    binary_industry_data.index = binary_industry_data.index.map(int)
-    data = (data.merge(binary_industry_data, left_on='id', right_on='id',how='left'))
-    data = data.drop(['industry'], axis=1)
+    industry_data = get_industry_flags(data["industry"])
+    data = pd.concat([data.drop(['industry'], axis=1),industry_data],axis=1)
 
     # if drop where all values are unhapppy
     if drop_not_happy == 'H':
@@ -198,24 +241,30 @@ def get_clean_data(directory,drop_not_happy='H',drop_gender=True,data_balance=Fa
     # data = data.sample(frac=1).reset_index(drop=True) ##Shuffle
 
     if data_balance != False:
-        programs = list(READ_PROGRAMS.values())
-        b_df = data.copy()
-        b_df = b_df.head(0)
-
-        for program in programs:
-            temp_df = data.copy()[data.program==program]
-            while len(temp_df) <= data_balance[program]:
-                temp_df = temp_df.append(temp_df)
-            temp_df = temp_df.head(data_balance[program])
-            b_df = b_df.append(temp_df)
-            b_df = b_df.reset_index(drop=True)
-        data = b_df
+        data = balance_data(data,data_balance)
 
     data.columns = data.columns.astype(str)
     return data
 
+def balance_data(data,data_balance,seed=None):
+    # repeats (or cuts) the rows of every program to the number of rows data_balance asks for, in one take
+    # of the row positions: each program's rows are cycled in order, or in a shuffled order fixed by seed
+    programs = list(READ_PROGRAMS.values())
+    program_rows = data.program.values
+    rng = np.random.RandomState(seed) if seed is not None else None
+    positions = []
+    for program in programs:
+        rows = np.flatnonzero(program_rows == program)
+        if len(rows) == 0:
+            print("No responses for "+program+", it is left out of the balanced data")
+            continue
+        if rng is not None:
+            rows = rng.permutation(rows)
+        positions.append(np.resize(rows,data_balance[program]))
+    return data.iloc[np.concatenate(positions)].reset_index(drop=True)
+
 def transform_post_dict(post_dict):
-    print("Transforming post_dict...")
+    logger.debug("Transforming post_dict...")
     post_dict = json.dumps(dict(post_dict))
     post_dict = json.loads(post_dict)
     post_dict = dict(post_dict)
@@ -232,27 +281,34 @@ def transform_post_dict(post_dict):
         post_dict[industry] = '1'
     return dict(post_dict)
 
+def get_label_codes(series):
+    # codes and categories of a cleaned column, a column left as text (gender) is numbered the way LabelEncoder did
+    if str(series.dtype) != 'category':
+        series = series.astype(str).astype('category')
+    return series.cat.codes.values, list(series.cat.categories)
+
+def get_encoded_dict_path(model_name):
+    return 'poc/quiz/exported_model_files/'+model_name+'_encoded_dictionary.json'
+
 def get_label_encoded_data(directory,model_name,column_list,drop_not_happy='H',data_balance=False):
+    import pandas as pd
     print("getting label encoded data...")
     df = get_clean_data(directory,drop_not_happy,data_balance=data_balance)
     print("Retrieved label encodede data...")
     df = df[column_list]
 
     col_list = list(df.columns)
-    encoded_dict_list = []
     print("encoding columns")
-    for col in col_list:
-        keys = df[col].unique()
-        le = preprocessing.LabelEncoder()
-        le.fit(list(keys))
-        df[col] = le.transform(list(df[col]))
-        vals = df[col].unique()
-        keys = list(le.inverse_transform(vals))
-        cd = dict(zip(keys,vals))
-        row = {str(col):cd}
-        encoded_dict_list.append(row)
-        with open('poc/quiz/exported_model_files/'+model_name+'_'+col+'_encoded_dictionary.json', 'w') as f:
-            json.dump(str(row),f,cls=NpEncoder)
+    # the cleaned columns are categorical, their codes are the label encoding
+    codes = np.empty((len(df),len(col_list)),dtype=np.int8)
+    encoded_dict = {}
+    for i, col in enumerate(col_list):
+        codes[:,i], categories = get_label_codes(df[col])
+        encoded_dict[col] = {col:{answer:code for code, answer in enumerate(categories)}}
+    df = pd.DataFrame(codes,index=df.index,columns=col_list)
+    encoded_dict_list = [encoded_dict[col] for col in col_list]
+    with open(get_encoded_dict_path(model_name), 'w') as f:
+        json.dump(encoded_dict,f)
     print("writing columns...")
     with open('poc/quiz/exported_model_files/'+model_name+'_cols.txt', 'w') as f:
         for col in col_list:
@@ -270,6 +326,11 @@ def get_encoded_dict(model_name):
             currentPlace = line[:-1]
             # add item to the list
             cols.append(currentPlace)
+    if os.path.exists(get_encoded_dict_path(model_name)):
+        with open(get_encoded_dict_path(model_name), 'r') as f:
+            encoded_dict = json.load(f)
+        return {col:encoded_dict[col] for col in cols}
+    # models exported before the combined dictionary have one file per column
     encoded_dict = {}
     for col in cols:
         with open('poc/quiz/exported_model_files/'+model_name+'_'+col+'_encoded_dictionary.json', 'r') as f:
@@ -278,6 +339,7 @@ def get_encoded_dict(model_name):
     return encoded_dict
 
 def get_merged_encoded_data(directory,model_name,one_hot_encode,column_list,drop_not_happy='H',data_balance=False):
+    import pandas as pd
     print("getting merged encoded data...")
     df = get_label_encoded_data(directory,model_name,column_list,drop_not_happy,data_balance)[0]
     print("received merged encoded data...")
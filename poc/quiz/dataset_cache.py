@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# imported by data_load.py and by build_model.py; pandas is only imported when a dataset is read or written
+
+DATASET_CACHE_DIRECTORY = 'poc/quiz/dataset_cache/'
+# bump when get_clean_data changes what it produces from the same export and arguments
+DATASET_CACHE_VERSION = 1
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path,'rb') as f:
+        for block in iter(lambda: f.read(1048576),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_dataset_key(namespace,path,params):
+    # the export's contents and everything else the cleaned data depends on, so an edit to either is a new entry;
+    # data_load.py and build_model.py each keep their own copy of the cleaning code, so each gets its own namespace
+    description = {'version':DATASET_CACHE_VERSION,'namespace':namespace,'source':hash_file(path),'params':params}
+    return hashlib.sha256(json.dumps(description,sort_keys=True).encode()).hexdigest()[:32]
+
+
+class DatasetCache:
+    '''
+    Cleaned datasets on disk, one entry per key: an .npz with the category
+    codes of every column as one matrix and the index, and a JSON file with
+    the columns and their categories. Columns that are not categorical (gender,
+    happy) are stored as categories of their values and come back as text.
+    Only the max_entries most recently used entries are kept.
+    '''
+    def __init__(self,directory=DATASET_CACHE_DIRECTORY,max_entries=20):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def get_path(self,key,suffix):
+        return os.path.join(self.directory,key+suffix)
+
+    def load(self,key):
+        import pandas as pd
+        try:
+            with open(self.get_path(key,'.json'),'r') as f:
+                meta = json.load(f)
+            with np.load(self.get_path(key,'.npz')) as arrays:
+                codes = arrays['codes']
+                index = arrays['index']
+        except (OSError,ValueError,KeyError):
+            return None
+        if meta.get('version') != DATASET_CACHE_VERSION:
+            return None
+        os.utime(self.get_path(key,'.json'))
+        columns = {}
+        for i, col in enumerate(meta['columns']):
+            column = pd.Categorical.from_codes(codes[:,i],categories=meta['categories'][i])
+            columns[col] = column if meta['categorical'][i] else np.asarray(column,dtype=object)
+        data = pd.DataFrame(columns,index=pd.Index(index,name=meta['index_name']),columns=meta['columns'])
+        data.columns = data.columns.astype(str)
+        return data
+
+    def save(self,key,data):
+        meta = {'version':DATASET_CACHE_VERSION,'columns':list(data.columns),'index_name':data.index.name,
+                'categories':[],'categorical':[]}
+        codes = []
+        for col in data.columns:
+            column = data[col]
+            meta['categorical'].append(str(column.dtype) == 'category')
+            if str(column.dtype) != 'category':
+                column = column.astype('category')
+            meta['categories'].append(list(column.cat.categories))
+            codes.append(column.cat.codes.values)
+        largest = max([len(categories) for categories in meta['categories']]+[0])
+        codes = np.array(codes,dtype=np.int8 if largest < 128 else np.int32).T.reshape(len(data),len(data.columns))
+        os.makedirs(self.directory,exist_ok=True)
+        # written beside the entry and renamed over it, so a build never reads half an entry
+        self._replace(self.get_path(key,'.npz'),lambda f: np.savez(f,codes=codes,index=np.asarray(data.index,dtype=np.int64)))
+        self._replace(self.get_path(key,'.json'),lambda f: f.write(json.dumps(meta).encode()))
+        self.trim()
+
+    def _replace(self,path,write):
+        handle, temp_path = tempfile.mkstemp(dir=self.directory,suffix='.tmp')
+        try:
+            with os.fdopen(handle,'wb') as f:
+                write(f)
+            os.replace(temp_path,path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def trim(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json'):
+                try:
+                    entries.append((os.stat(os.path.join(self.directory,filename)).st_mtime,filename[:-5]))
+                except OSError:
+                    pass
+        for modified, key in sorted(entries,reverse=True)[self.max_entries:]:
+            for suffix in ('.npz','.json'):
+                try:
+                    os.remove(self.get_path(key,suffix))
+                except OSError:
+                    pass
@@ -174,6 +174,31 @@ READ_ESSAY = {
             'A bit apprehensive. I get overwhelmed with so many options.':'partial'
             }
 
+# the answers every cleaned column can hold, their sorted order is the column's label codes
+COLUMN_ANSWERS = {
+            'program':READ_PROGRAMS,
+            'problem_type':READ_PROBLEMS,
+            'creative':READ_CREATIVE,
+            'outdoors':READ_OUTDOORS,
+            'career':READ_CAREERS,
+            'group_work':READ_GROUPWORK,
+            'liked_courses':READ_COURSES,
+            'disliked_courses':READ_COURSES,
+            'programming':READ_PROGRAMMING,
+            'join_clubs':READ_CLUBS,
+            'not_clubs':READ_CLUBS,
+            'liked_projects':READ_PROJECTS,
+            'disliked_projects':READ_PROJECTS,
+            'tv_shows':READ_TV,
+            'alternate_degree':READ_ALTERNATE_DEGREE,
+            'expensive_equipment':READ_EQUIPMENT,
+            'drawing':READ_DRAWING,
+            'essay':READ_ESSAY
+            }
+# questions the survey let respondents skip, a skipped answer is the answer 'nan'
+SKIPPABLE_COLUMNS = ['join_clubs','not_clubs']
+INDUSTRY_ANSWERS = ['0','1']
+
 INDEX_PROGRAM = {
                 'mech': 9,
                 'bmed': 2,
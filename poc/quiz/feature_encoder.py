@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class FeatureEncoder:
+    '''
+    Maps a transformed post_dict straight to the model's feature vector.
+
+    Built once per model from its column list, the _cat index and the encoded
+    dictionaries. For every question, each possible answer is resolved ahead of
+    time to a (feature index, value) pair:
+      - label encoded models ('le') and the binary industry columns of 'ohe'
+        models put the answer's label code in the column's own slot
+      - one hot encoded questions put a 1 in the '<column>_<label code>' slot
+    '''
+    def __init__(self,model_name,columns,index_dict,encoded_dict):
+        self.model_name = model_name
+        self.columns = [col for col in columns if col != 'program']
+        self.n_features = len(index_dict)
+        self.lookup = {}
+        for col in self.columns:
+            codes = encoded_dict[col][col]
+            answers = {}
+            for answer, code in codes.items():
+                if col in index_dict:
+                    answers[answer] = (index_dict[col],float(code))
+                elif col+'_'+str(code) in index_dict:
+                    answers[answer] = (index_dict[col+'_'+str(code)],1.0)
+                else:
+                    # answer was never seen in training so it has no one hot column
+                    answers[answer] = None
+            self.lookup[col] = answers
+
+    def get_answer(self,post_dict,col):
+        answer = post_dict[col]
+        if isinstance(answer,list):
+            answer = answer[0]
+        return answer
+
+    def get_indices(self,post_dict):
+        indices = []
+        values = []
+        for col in self.columns:
+            feature = self.lookup[col][self.get_answer(post_dict,col)]
+            if feature is not None:
+                indices.append(feature[0])
+                values.append(feature[1])
+        return indices, values
+
+    def encode(self,post_dict,out=None):
+        if out is None:
+            out = np.zeros(self.n_features)
+        else:
+            out[:] = 0
+        indices, values = self.get_indices(post_dict)
+        out[indices] = values
+        return out
+
+    def encode_batch(self,post_dicts):
+        # one row per response, filled with a single scatter into the preallocated matrix
+        out = np.zeros((len(post_dicts),self.n_features))
+        rows = []
+        columns = []
+        values = []
+        for row, post_dict in enumerate(post_dicts):
+            row_indices, row_values = self.get_indices(post_dict)
+            rows.extend([row]*len(row_indices))
+            columns.extend(row_indices)
+            values.extend(row_values)
+        out[rows,columns] = values
+        return out
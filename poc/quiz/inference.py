@@ -0,0 +1,137 @@
+import ast
+import logging
+import time
+
+from django.db.models import Count
+
+from . data_load import *
+from . models import *
+from . model_registry import *
+from . model_router import *
+from . prediction_cache import *
+from . metrics import *
+
+logger = logging.getLogger(__name__)
+
+
+def get_answers(loaded_model,post_dict):
+    # the model's answer columns, normalized to one string per question
+    encoder = loaded_model.encoder
+    answers = {}
+    for col in encoder.columns:
+        answers[col] = str(encoder.get_answer(post_dict,col))
+    return answers
+
+def get_prediction_key(post_dict,model_name=MODEL_NAME):
+    loaded_model = get_loaded_model(model_name)
+    return get_answer_key(get_answers(loaded_model,post_dict),loaded_model.version)
+
+def get_prediction(post_dict,model_name=MODEL_NAME,use_cache=True):
+    # returns ({program: probability}, [programs from best to worst match]) for a transformed post_dict
+    loaded_model = get_loaded_model(model_name)
+    encoder = loaded_model.encoder
+    with time_stage('encode'):
+        answers = get_answers(loaded_model,post_dict)
+        key = get_answer_key(answers,loaded_model.version)
+        cached = PREDICTION_CACHE.get(key) if use_cache else None
+        if cached is None:
+            indices, values = encoder.get_indices(answers)
+    if cached is not None:
+        return dict(cached[0]), list(cached[1])
+
+    with time_stage('predict'):
+        kernel = loaded_model.kernel
+        prediction = kernel.predict_proba_sparse(indices,values)
+        results_dict = retrieve_prediction_labels(kernel,prediction)
+        results = rank_prediction_labels(kernel,prediction)
+    if use_cache:
+        PREDICTION_CACHE.set(key,(results_dict,results))
+    return dict(results_dict), list(results)
+
+def get_shadow_prediction(post_dict,model_name):
+    # shadow models are scored past the prediction cache, so they neither fill it nor count in its hit rate
+    return get_prediction(post_dict,model_name,use_cache=False)
+
+def choose_model(post_dict):
+    # the traffic split is applied to the answers as the primary model reads them
+    primary = get_loaded_model(MODEL_ROUTER.primary)
+    with time_stage('route'):
+        return MODEL_ROUTER.choose(get_answer_key(get_answers(primary,post_dict),'route'))
+
+def get_routed_prediction_key(post_dict):
+    # returns (model_name, key) for the model get_routed_prediction will score with, the primary if the candidate fails
+    model_name = choose_model(post_dict)
+    if model_name != MODEL_ROUTER.primary:
+        start = time.monotonic()
+        try:
+            return model_name, get_prediction_key(post_dict,model_name)
+        except Exception as e:
+            if not isinstance(e,KeyError):
+                MODEL_ROUTER.record(model_name,time.monotonic()-start,error=True)
+            logger.warning("Keying with %s failed, falling back to %s: %s", model_name, MODEL_ROUTER.primary, e)
+            model_name = MODEL_ROUTER.primary
+    return model_name, get_prediction_key(post_dict,model_name)
+
+def get_routed_prediction(post_dict,model_name=None):
+    # returns (model_name, results_dict, results) from the model the traffic split assigns to these answers
+    if model_name is None:
+        model_name = choose_model(post_dict)
+    start = time.monotonic()
+    try:
+        results_dict, results = get_prediction(post_dict,model_name)
+    except Exception as e:
+        # a KeyError is an answer the model does not know, the client's mistake rather than the model's
+        if not isinstance(e,KeyError):
+            MODEL_ROUTER.record(model_name,time.monotonic()-start,error=True)
+        if model_name == MODEL_ROUTER.primary:
+            raise
+        logger.warning("Scoring with %s failed, falling back to %s: %s", model_name, MODEL_ROUTER.primary, e)
+        model_name = MODEL_ROUTER.primary
+        start = time.monotonic()
+        results_dict, results = get_prediction(post_dict,model_name)
+    MODEL_ROUTER.record(model_name,time.monotonic()-start)
+    MODEL_ROUTER.shadow(get_shadow_prediction,post_dict,model_name,results)
+    return model_name, results_dict, results
+
+def parse_result_answer(value):
+    # Result rows store the posted answer lists as their string representation, e.g. "['creative']"
+    if value.startswith('['):
+        return ast.literal_eval(value)
+    return value
+
+def prewarm_prediction_cache(limit,model_name=MODEL_NAME):
+    loaded_model = get_loaded_model(model_name)
+    columns = loaded_model.encoder.columns
+    frequent = (Result.objects.values(*columns)
+                              .annotate(responses=Count('id'))
+                              .order_by('-responses')[:limit])
+    warmed = 0
+    for row in frequent:
+        post_dict = {}
+        for col in columns:
+            post_dict[col] = parse_result_answer(row[col])
+        try:
+            get_prediction(post_dict,model_name)
+            warmed += 1
+        except KeyError:
+            logger.debug("Skipping stored response with an unknown answer")
+    logger.info("Prediction cache pre-warmed with %d responses", warmed)
+    return warmed
+
+def get_batch_predictions(post_dicts,model_name=MODEL_NAME):
+    # scores every transformed post_dict with one predict_proba call on the encoded matrix
+    loaded_model = get_loaded_model(model_name)
+    kernel = loaded_model.kernel
+    with time_stage('encode'):
+        X = loaded_model.encoder.encode_batch(post_dicts)
+    with time_stage('predict'):
+        prediction = kernel.predict_proba(X)
+        labels = [INV_INDEX_PROGRAM[label] for label in kernel.classes_]
+        rounded = np.round(prediction,4).tolist()
+        order = rank_classes(prediction).tolist()
+    predictions = []
+    for i in range(len(post_dicts)):
+        results_dict = dict(zip(labels,rounded[i]))
+        results = [labels[j] for j in order[i]]
+        predictions.append((results_dict,results))
+    return predictions
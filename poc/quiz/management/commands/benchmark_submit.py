@@ -0,0 +1,278 @@
+import csv
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+
+from poc.quiz.benchmark import *
+from poc.quiz.dictionaries import *
+from poc.quiz.memory_report import *
+from poc.quiz.models import Result
+from poc.quiz.result_buffer import RESULT_BUFFER
+
+DEFAULT_CSVS = ['poc/quiz/quiz_data_.csv','poc/quiz/exported_model_files/t7.csv']
+
+# the answers the quiz form posts, and how the survey wrote them
+FORM_ANSWERS = {
+    'creative':READ_CREATIVE,
+    'outdoors':READ_OUTDOORS,
+    'career':READ_CAREERS,
+    'group_work':READ_GROUPWORK,
+    'liked_courses':READ_COURSES,
+    'disliked_courses':READ_COURSES,
+    'join_clubs':READ_CLUBS,
+    'not_clubs':READ_CLUBS,
+    'liked_projects':READ_PROJECTS,
+    'disliked_projects':READ_PROJECTS,
+    'alternate_degree':READ_ALTERNATE_DEGREE,
+    'drawing':READ_DRAWING,
+    'essay':READ_ESSAY
+}
+
+# submit answers its failures with a 200 "Something went wrong" page, only the rendered results count as a success
+RECOMMENDATIONS_MARKER = b'<h2>Your Results Are In</h2>'
+
+
+def load_submit_payloads(path):
+    '''
+    Turns the rows of a survey export into the POST data the quiz form sends:
+    one list per question, industry holding every industry picked. Rows with
+    an answer the form does not offer are skipped.
+    '''
+    payloads = []
+    with open(path,'r',encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            answers = {READ_HEADERS[header]:value for header, value in row.items() if header in READ_HEADERS}
+            payload = {}
+            for name, choices in FORM_ANSWERS.items():
+                answer = choices.get(answers.get(name))
+                if answer is None:
+                    break
+                payload[name] = [answer]
+            else:
+                # quiz_data_.csv separates the industries with ';' and t7.csv with ', '
+                raw = answers.get('industry') or ''
+                payload['industry'] = [industry for text, industry in READ_INDUSTRY.items() if text in raw]
+                payloads.append(payload)
+    return payloads
+
+def is_local_database(database):
+    # sqlite files and servers on this machine; anything else (DATABASE_URL on Heroku) may hold real submissions
+    return database['ENGINE'].endswith('sqlite3') or database.get('HOST','') in ('','localhost','127.0.0.1','::1')
+
+def is_recommendations_page(status,body):
+    return status == 200 and RECOMMENDATIONS_MARKER in body
+
+def get_worker_pids(master_pid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/'+name+'/stat','r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the parent pid is the second field after the parenthesized command name
+        if int(stat.rsplit(')',1)[1].split()[1]) == master_pid:
+            pids.append(int(name))
+    return sorted(pids)
+
+def get_process_memory(pids):
+    memory = {}
+    for pid in pids:
+        try:
+            memory[str(pid)] = summarize_smaps(read_smaps('/proc/'+str(pid)+'/smaps'))
+        except OSError:
+            pass
+    return memory
+
+
+class Command(BaseCommand):
+    help = ('Replays survey responses as quiz submissions through the Django test client and a local gunicorn, '
+            'and reports latency percentiles, throughput and memory per worker as JSON')
+
+    def add_arguments(self,parser):
+        parser.add_argument('--csv',action='append',dest='csvs',help='Survey export to replay (default: quiz_data_.csv and t7.csv)')
+        parser.add_argument('--requests',type=int,default=500,help='Submissions measured per run')
+        parser.add_argument('--warmup',type=int,default=20,help='Submissions sent before measuring')
+        parser.add_argument('--concurrency',default='1,4',help='Comma separated numbers of concurrent clients')
+        parser.add_argument('--target',choices=['client','gunicorn','both'],default='both')
+        parser.add_argument('--workers',type=int,default=2,help='gunicorn workers')
+        parser.add_argument('--bind',default='127.0.0.1:8799',help='Address the local gunicorn listens on')
+        parser.add_argument('--output',default='benchmark_submit.json',help='Where the results are written')
+        parser.add_argument('--baseline',help='Earlier results to compare with, the command fails on a regression')
+        parser.add_argument('--tolerance',type=float,default=0.2,help='Allowed slowdown relative to the baseline')
+        parser.add_argument('--keep-results',action='store_true',help='Keep the Result rows the benchmark creates')
+
+    def handle(self,*args,**options):
+        # the replayed submissions are stored like real ones and then deleted by id, so never on a shared database
+        database = connections['default'].settings_dict
+        if not is_local_database(database):
+            raise CommandError("Refusing to benchmark against the database on "+database['HOST']+
+                               ", point DATABASE_URL at a local database first")
+        payloads = []
+        for path in options['csvs'] or DEFAULT_CSVS:
+            loaded = load_submit_payloads(path)
+            self.stdout.write("Loaded "+str(len(loaded))+" responses from "+path)
+            payloads.extend(loaded)
+        if not payloads:
+            raise CommandError("No responses to replay")
+        concurrencies = [int(value) for value in options['concurrency'].split(',')]
+        first_result = Result.objects.aggregate(last=Max('id'))['last'] or 0
+
+        runs = []
+        try:
+            if options['target'] in ('client','both'):
+                for concurrency in concurrencies:
+                    runs.append(self.run_client(payloads,options['requests'],options['warmup'],concurrency))
+            if options['target'] in ('gunicorn','both'):
+                runs.extend(self.run_gunicorn(payloads,options,concurrencies))
+        finally:
+            if not options['keep_results']:
+                RESULT_BUFFER.flush()
+                Result.objects.filter(id__gt=first_result).delete()
+
+        for run in runs:
+            self.stdout.write('%(target)s x%(concurrency)d: p50 %(p50_ms).2fms p95 %(p95_ms).2fms p99 %(p99_ms).2fms, '
+                              '%(throughput).1f req/s, %(errors)d errors' % run)
+        # timings of failed submissions measure the error path, so they are never written where a baseline could come from
+        errors = sum(run['errors'] for run in runs)
+        if errors:
+            raise CommandError(str(errors)+" submissions did not return the recommendations page, "
+                               "nothing was written to "+options['output'])
+
+        results = get_run_info()
+        results['responses'] = len(payloads)
+        results['runs'] = runs
+        write_results(options['output'],results)
+        self.stdout.write("Results written to "+options['output'])
+
+        if options['baseline']:
+            regressions = compare_to_baseline(runs,read_results(options['baseline'])['runs'],('target','concurrency'),
+                                              ('p50_ms','p95_ms','p99_ms'),('throughput',),options['tolerance'])
+            if regressions:
+                raise CommandError("Slower than "+options['baseline']+":\n"+'\n'.join(format_regression(r) for r in regressions))
+            self.stdout.write("No regression against "+options['baseline'])
+
+    def replay(self,send,payloads,requests,warmup,concurrency):
+        # every client thread sends every concurrency-th payload, latencies are per submission
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def client(offset):
+            session = send()
+            try:
+                for i in range(offset,warmup+requests,concurrency):
+                    start = time.perf_counter()
+                    ok = session(payloads[i % len(payloads)])
+                    elapsed = time.perf_counter() - start
+                    if i >= warmup:
+                        with lock:
+                            latencies.append(elapsed)
+                            if not ok:
+                                errors.append(i)
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(client,offset) for offset in range(concurrency)]:
+                future.result()
+        wall = time.perf_counter() - start
+        summary = summarize_latencies(latencies,wall)
+        summary['errors'] = len(errors)
+        summary['concurrency'] = concurrency
+        return summary
+
+    def run_client(self,payloads,requests,warmup,concurrency):
+        path = reverse('submit')
+
+        def send():
+            client = Client()
+
+            def send_payload(payload):
+                response = client.post(path,payload)
+                return is_recommendations_page(response.status_code,response.content)
+            return send_payload
+        self.stdout.write("Replaying through the test client with "+str(concurrency)+" clients...")
+        run = self.replay(send,payloads,requests,warmup,concurrency)
+        run['target'] = 'client'
+        run['memory'] = {str(os.getpid()):get_memory_report()}
+        return run
+
+    def run_gunicorn(self,payloads,options,concurrencies):
+        base_url = 'http://'+options['bind']
+        env = dict(os.environ,WEB_CONCURRENCY=str(options['workers']))
+        # the gunicorn script installed beside this interpreter, so it serves with the same packages
+        gunicorn = shutil.which('gunicorn',path=os.path.dirname(sys.executable)+os.pathsep+os.environ.get('PATH',''))
+        if gunicorn is None:
+            raise CommandError("gunicorn is not installed")
+        server = subprocess.Popen([gunicorn,'poc.wsgi','-c','gunicorn.conf.py','-b',options['bind']],
+                                  cwd=settings.BASE_DIR,env=env)
+        try:
+            self.wait_until_ready(server,base_url+reverse('readiness'))
+            runs = []
+            for concurrency in concurrencies:
+                self.stdout.write("Replaying against gunicorn ("+str(options['workers'])+" workers) with "+str(concurrency)+" clients...")
+                run = self.replay(lambda: self.open_session(base_url),payloads,options['requests'],options['warmup'],concurrency)
+                run['target'] = 'gunicorn'
+                run['workers'] = options['workers']
+                run['memory'] = get_process_memory(get_worker_pids(server.pid))
+                runs.append(run)
+            return runs
+        finally:
+            # the workers flush their queued results on the way out
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+    def wait_until_ready(self,server,url,timeout=60):
+        # every worker has to answer before measuring, the readiness view fails until the model is warm
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("gunicorn exited with status "+str(server.returncode))
+            try:
+                if urllib.request.urlopen(url,timeout=5).status == 200:
+                    return
+            except (urllib.error.URLError,OSError):
+                pass
+            time.sleep(0.2)
+        raise CommandError("gunicorn did not become ready within "+str(timeout)+"s")
+
+    def open_session(self,base_url):
+        # picks up the csrf cookie from the quiz page like a browser would
+        cookies = urllib.request.HTTPCookieProcessor()
+        opener = urllib.request.build_opener(cookies)
+        opener.open(base_url+reverse('quiz')).read()
+        token = ''
+        for cookie in cookies.cookiejar:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                token = cookie.value
+        url = base_url+reverse('submit')
+
+        def send(payload):
+            request = urllib.request.Request(url,data=urllib.parse.urlencode(payload,doseq=True).encode(),
+                                             headers={'X-CSRFToken':token})
+            try:
+                with opener.open(request,timeout=30) as response:
+                    return is_recommendations_page(response.status,response.read())
+            except urllib.error.HTTPError as e:
+                e.read()
+                return False
+        return send
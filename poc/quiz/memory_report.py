@@ -0,0 +1,44 @@
+import os
+import re
+
+SMAPS_FIELD = re.compile(r'^(\w+):\s+(\d+) kB$')
+SMAPS_FIELDS = ('Size','Rss','Pss','Shared_Clean','Shared_Dirty','Private_Clean','Private_Dirty')
+
+
+def read_smaps(path='/proc/self/smaps',suffix=None):
+    # sums the kB fields over every mapping, or only over files whose name ends with suffix
+    totals = dict.fromkeys(SMAPS_FIELDS,0)
+    include = suffix is None
+    with open(path,'r') as f:
+        for line in f:
+            match = SMAPS_FIELD.match(line)
+            if match is None:
+                if ':' not in line.split(' ',1)[0]:
+                    # header line of the next mapping: address range, permissions, ..., pathname
+                    parts = line.split()
+                    include = suffix is None or (len(parts) >= 6 and parts[-1].endswith(suffix))
+                continue
+            if include and match.group(1) in totals:
+                totals[match.group(1)] += int(match.group(2))
+    return totals
+
+def summarize_smaps(totals):
+    return {
+        'rss_bytes':totals['Rss']*1024,
+        'pss_bytes':totals['Pss']*1024,
+        'shared_bytes':(totals['Shared_Clean']+totals['Shared_Dirty'])*1024,
+        'private_bytes':(totals['Private_Clean']+totals['Private_Dirty'])*1024
+    }
+
+def get_memory_report(bundle_suffix='.bundle'):
+    '''
+    Resident vs shared memory of this worker, overall and for the mapped model
+    bundles. Shared pages are counted once per dyno, pss splits them evenly
+    between the processes mapping them. Empty where /proc is not available.
+    '''
+    if not os.path.exists('/proc/self/smaps'):
+        return {}
+    report = summarize_smaps(read_smaps())
+    report['pid'] = os.getpid()
+    report['model_bundles'] = summarize_smaps(read_smaps(suffix=bundle_suffix))
+    return report
@@ -0,0 +1,90 @@
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# a submit takes well under a millisecond to score and a few milliseconds to render
+LATENCY_BUCKETS = (.0001,.00025,.0005,.001,.0025,.005,.01,.025,.05,.1,.25,.5,1.0,2.5,5.0,10.0)
+
+REQUEST_SECONDS = Histogram('quiz_request_seconds','Time taken to answer a request, by view',
+                            ['view'],buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram('quiz_stage_seconds','Time spent in each stage of answering a request, by view',
+                          ['view','stage'],buckets=LATENCY_BUCKETS)
+REQUESTS = Counter('quiz_requests_total','Requests answered, by view and status code',['view','status'])
+ERRORS = Counter('quiz_request_errors_total','Requests that raised, answered with a server error or with an error page, by view',['view'])
+
+_request = threading.local()
+
+
+def get_sample_rate():
+    from django.conf import settings
+    return getattr(settings,'LOG_SAMPLE_RATE',1.0)
+
+def instrument_view(name):
+    '''
+    Counts and times every call of a view, and decides once per request
+    whether its debug and info log lines are kept (see RequestSampleFilter).
+    Stage timers only record inside an instrumented view, so scoring done at
+    startup or on the shadow threads does not show up as request stages.
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request,*args,**kwargs):
+            _request.view = name
+            _request.sampled = random.random() < get_sample_rate()
+            start = time.monotonic()
+            try:
+                response = view(request,*args,**kwargs)
+            except Exception:
+                ERRORS.labels(name).inc()
+                REQUESTS.labels(name,'500').inc()
+                raise
+            finally:
+                REQUEST_SECONDS.labels(name).observe(time.monotonic()-start)
+                _request.view = None
+                _request.sampled = None
+            if response.status_code >= 500:
+                ERRORS.labels(name).inc()
+            REQUESTS.labels(name,str(response.status_code)).inc()
+            return response
+        return wrapper
+    return decorator
+
+@contextmanager
+def time_stage(stage):
+    view = getattr(_request,'view',None)
+    if view is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(view,stage).observe(time.monotonic()-start)
+
+def render_metrics():
+    # gunicorn workers each write their samples to prometheus_multiproc_dir, any worker can merge them
+    registry = REGISTRY
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class RequestSampleFilter(logging.Filter):
+    '''
+    Keeps warnings and errors, and the debug and info lines of the sampled
+    requests (LOG_SAMPLE_RATE of them). Lines logged outside a request, at
+    startup or from background threads, are always kept.
+    '''
+    def filter(self,record):
+        if record.levelno >= logging.WARNING:
+            return True
+        sampled = getattr(_request,'sampled',None)
+        return sampled is None or sampled
@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from . data_load import *
+from . activate_model import *
+from . bundle import *
+from . feature_encoder import *
+from . scoring import *
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIRECTORY = 'poc/quiz/exported_model_files/'
+
+# Number of models kept in memory per worker before the least recently used is evicted
+MAX_LOADED_MODELS = 3
+
+# Seconds between checks of the artifact files for changes on disk
+ARTIFACT_CHECK_INTERVAL = 5
+
+
+def read_model_columns(model_name):
+    cols = []
+    with open(MODEL_DIRECTORY+model_name+'_cols.txt', 'r') as f:
+        for line in f:
+            cols.append(line[:-1])
+    return cols
+
+def get_artifact_paths(model_name,columns):
+    # a bundle replaces every other artifact of the model
+    bundle_path = get_bundle_path(MODEL_DIRECTORY,model_name)
+    if os.path.exists(bundle_path):
+        return [bundle_path]
+    paths = [
+        MODEL_DIRECTORY+model_name+'.pkl',
+        MODEL_DIRECTORY+model_name+'_cat',
+        MODEL_DIRECTORY+model_name+'_cols.txt'
+    ]
+    for backend in BACKENDS:
+        paths.append(get_kernel_path(MODEL_DIRECTORY,model_name,backend))
+    # the combined encoded dictionary, or the per-column ones of models exported before it
+    paths.append(MODEL_DIRECTORY+model_name+'_encoded_dictionary.json')
+    for col in columns:
+        paths.append(MODEL_DIRECTORY+model_name+'_'+col+'_encoded_dictionary.json')
+    return paths
+
+def get_artifact_signature(paths):
+    # (path, modified time, size) of every artifact; any change means the model was rebuilt
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path,stat.st_mtime_ns,stat.st_size))
+        except OSError:
+            signature.append((path,None,None))
+    return tuple(signature)
+
+
+def load_pickled_model(model_name):
+    with open(MODEL_DIRECTORY+model_name+'.pkl', 'rb') as pkl_file:
+        return pickle.load(pkl_file)
+
+
+class LoadedModel:
+    def __init__(self,model_name,kernel,index_dict,columns,encoded_dict,signature,bundle=None):
+        self.model_name = model_name
+        self.kernel = kernel
+        self.bundle = bundle
+        self.index_dict = index_dict
+        self.columns = columns
+        self.encoded_dict = encoded_dict
+        self.encoder = FeatureEncoder(model_name,columns,index_dict,encoded_dict)
+        self.signature = signature
+        self.version = model_name+':'+hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:12]
+        self.checked_at = time.monotonic()
+
+
+class ModelRegistry:
+    '''
+    Keeps the scoring kernel, column list and encoded dictionaries of each model in
+    memory so a request never touches the exported_model_files directory.
+    '''
+    def __init__(self,max_models=MAX_LOADED_MODELS,check_interval=ARTIFACT_CHECK_INTERVAL):
+        self.max_models = max_models
+        self.check_interval = check_interval
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self,model_name=MODEL_NAME):
+        with self._lock:
+            loaded = self._models.get(model_name)
+            if loaded is not None and not self._is_stale(loaded):
+                self._models.move_to_end(model_name)
+                return loaded
+
+            loaded = self._load(model_name)
+            self._models[model_name] = loaded
+            self._models.move_to_end(model_name)
+            while len(self._models) > self.max_models:
+                evicted_name, evicted = self._models.popitem(last=False)
+                logger.info("Evicted model %s", evicted_name)
+            return loaded
+
+    def evict(self,model_name):
+        with self._lock:
+            self._models.pop(model_name,None)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._models.keys())
+
+    def _is_stale(self,loaded):
+        now = time.monotonic()
+        if now - loaded.checked_at < self.check_interval:
+            return False
+        loaded.checked_at = now
+        paths = get_artifact_paths(loaded.model_name,loaded.columns)
+        return get_artifact_signature(paths) != loaded.signature
+
+    def _load(self,model_name):
+        bundle_path = get_bundle_path(MODEL_DIRECTORY,model_name)
+        if os.path.exists(bundle_path):
+            return self._load_bundle(model_name,bundle_path)
+        logger.info("Loading model artifacts for %s", model_name)
+        columns = read_model_columns(model_name)
+        # Taking the signature before reading means a rebuild during the load is picked up on the next check
+        signature = get_artifact_signature(get_artifact_paths(model_name,columns))
+        encoded_dict = get_encoded_dict(model_name)
+        with open(MODEL_DIRECTORY+model_name+'_cat', 'rb') as pkl_file:
+            index_dict = pickle.load(pkl_file)
+        kernel_path = find_kernel_path(MODEL_DIRECTORY,model_name)
+        if kernel_path is not None:
+            kernel = load_kernel(kernel_path)
+        else:
+            logger.warning("No exported kernel found, deriving it from %s.pkl", model_name)
+            kernel = kernel_from_model(load_pickled_model(model_name))
+        return LoadedModel(model_name,kernel,index_dict,columns,encoded_dict,signature)
+
+    def _load_bundle(self,model_name,bundle_path):
+        logger.info("Loading model bundle for %s", model_name)
+        signature = get_artifact_signature([bundle_path])
+        bundle = ModelBundle(bundle_path)
+        kernel = kernel_from_arrays(bundle.backend,bundle.arrays,bundle.classes)
+        return LoadedModel(model_name,kernel,bundle.index_dict,bundle.columns,bundle.encoded_dict,signature,bundle=bundle)
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+def get_loaded_model(model_name=MODEL_NAME):
+    return MODEL_REGISTRY.get(model_name)
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . activate_model import *
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    '''
+    Running latency counters for one model, plus how often its ranking agreed
+    with the served one when it was scored in shadow.
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.compared = 0
+        self.top1_agreements = 0
+        self.top3_overlap = 0
+
+    def as_dict(self):
+        return {
+            'requests':self.requests,
+            'errors':self.errors,
+            'mean_seconds':(self.total_seconds/self.requests) if self.requests else 0.0,
+            'max_seconds':self.max_seconds,
+            'compared':self.compared,
+            'top1_agreement':(self.top1_agreements/self.compared) if self.compared else None,
+            'top3_overlap':(self.top3_overlap/(3.0*self.compared)) if self.compared else None
+        }
+
+
+class ModelRouter:
+    '''
+    Picks the model that serves a response and scores the shadow models on a
+    background thread pool. A response always goes to the same model: its
+    answer hash is mapped onto [0, 1) and compared with the cumulative split,
+    and whatever share is left over goes to the primary model.
+    '''
+    def __init__(self,primary,split=None,shadow_models=None,shadow_workers=2,max_pending=100):
+        self.primary = primary
+        self.split = sorted((split or {}).items())
+        if sum(share for name, share in self.split) > 1:
+            raise ValueError("MODEL_TRAFFIC_SPLIT shares add up to more than 1")
+        self.shadow_models = list(shadow_models or [])
+        self.shadow_workers = shadow_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.shadow_dropped = 0
+        self.serving = {}
+        self.shadow_stats = {}
+
+    def choose(self,answer_key):
+        if not self.split:
+            return self.primary
+        bucket = int(answer_key[:8],16)/float(0x100000000)
+        upper = 0.0
+        for model_name, share in self.split:
+            upper += share
+            if bucket < upper:
+                return model_name
+        return self.primary
+
+    def record(self,model_name,seconds,error=False,shadow=False):
+        with self._lock:
+            stats_by_model = self.shadow_stats if shadow else self.serving
+            stats = stats_by_model.setdefault(model_name,ModelStats())
+            stats.requests += 1
+            if error:
+                stats.errors += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds,seconds)
+
+    def shadow(self,score,post_dict,served_model,served_results):
+        # score(post_dict, model_name) -> (results_dict, results) runs off the response path
+        for model_name in self.shadow_models:
+            if model_name == served_model:
+                continue
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    self.shadow_dropped += 1
+                    continue
+                self._pending += 1
+            self._get_executor().submit(self._score_shadow,score,model_name,post_dict,served_results)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'primary':self.primary,
+                'split':dict(self.split),
+                'serving':{name:stats.as_dict() for name, stats in self.serving.items()},
+                'shadow':{name:stats.as_dict() for name, stats in self.shadow_stats.items()},
+                'shadow_pending':self._pending,
+                'shadow_dropped':self.shadow_dropped
+            }
+
+    def _get_executor(self):
+        # one pool per process, threads do not survive a gunicorn fork
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.shadow_workers)
+            return self._executor
+
+    def _score_shadow(self,score,model_name,post_dict,served_results):
+        start = time.monotonic()
+        try:
+            results_dict, results = score(post_dict,model_name)
+        except Exception as e:
+            logger.warning("Shadow scoring with %s failed: %s", model_name, e)
+            self.record(model_name,time.monotonic()-start,error=True,shadow=True)
+            return
+        finally:
+            with self._lock:
+                self._pending -= 1
+        self.record(model_name,time.monotonic()-start,shadow=True)
+        with self._lock:
+            stats = self.shadow_stats[model_name]
+            stats.compared += 1
+            stats.top1_agreements += int(results[0] == served_results[0])
+            stats.top3_overlap += len(set(results[:3]) & set(served_results[:3]))
+
+
+MODEL_ROUTER = ModelRouter(MODEL_NAME,MODEL_TRAFFIC_SPLIT,SHADOW_MODELS,SHADOW_WORKERS)
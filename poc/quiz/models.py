@@ -107,6 +107,7 @@ class Result(models.Model):
     syde = models.CharField(max_length=200,default=None)
     swe = models.CharField(max_length=200,default=None)
     tron = models.CharField(max_length=200,default=None)
+    model_name = models.CharField(max_length=200,default='',blank=True)
 
     def __str__(self):
         return_value = (
@@ -0,0 +1,42 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def get_page_cache_key(name,version):
+    return 'quiz:page:'+name+':'+str(version)
+
+def render_page(request,template_name,context):
+    content = render_to_string(template_name,context,request=request).encode('utf-8')
+    return {
+        'content':content,
+        'etag':'"'+hashlib.sha1(content).hexdigest()+'"',
+        'last_modified':int(time.time())
+    }
+
+def render_cached_page(request,name,template_name,get_context=None,version=''):
+    '''
+    Renders template_name once per version into the cache and serves every
+    later hit from there, answering If-None-Match/If-Modified-Since with a
+    304. Only for pages that look the same to every visitor (no csrf_token).
+    '''
+    key = get_page_cache_key(name,version)
+    page = cache.get(key)
+    if page is None:
+        context = get_context() if get_context is not None else {}
+        page = render_page(request,template_name,context)
+        cache.set(key,page,settings.PAGE_CACHE_TIMEOUT)
+
+    response = get_conditional_response(request,etag=page['etag'],last_modified=page['last_modified'])
+    if response is None:
+        response = HttpResponse(page['content'])
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(page['last_modified'])
+    patch_cache_control(response,public=True,max_age=settings.PAGE_CACHE_MAX_AGE)
+    return response
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def get_answer_key(answers,model_version):
+    # canonical hash of the normalized answers, independent of the order they were posted in
+    canonical = json.dumps([model_version,sorted(answers.items())],separators=(',',':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    '''
+    Bounded LRU cache of model outputs keyed on the answers and the model version.
+    Entries older than ttl seconds are treated as misses (ttl=None keeps them until evicted).
+    '''
+    def __init__(self,max_size=1024,ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self,key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() > entry[0]:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self,key,value):
+        if self.max_size <= 0:
+            return
+        expires_at = None
+        if self.ttl is not None:
+            expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expires_at,value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size':len(self._entries),
+                'max_size':self.max_size,
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'hit_rate':(self.hits/lookups) if lookups else 0.0
+            }
+
+
+PREDICTION_CACHE = PredictionCache(
+    max_size=getattr(settings,'PREDICTION_CACHE_SIZE',1024),
+    ttl=getattr(settings,'PREDICTION_CACHE_TTL',None)
+)
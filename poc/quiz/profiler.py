@@ -0,0 +1,190 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_NAME = re.compile(r'^[0-9]+_[0-9]+_[0-9]+$')
+
+
+class QueryRecorder:
+    '''
+    Installed with connection.execute_wrapper for the profiled request: counts
+    the queries and their time, and keeps the slowest ones.
+    '''
+    def __init__(self,keep=10):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []
+
+    def __call__(self,execute,sql,params,many,context):
+        start = time.monotonic()
+        try:
+            return execute(sql,params,many,context)
+        finally:
+            elapsed = time.monotonic() - start
+            self.count += 1
+            self.seconds += elapsed
+            self.slowest.append((elapsed,sql))
+            self.slowest = sorted(self.slowest,key=lambda query: -query[0])[:self.keep]
+
+    def as_dict(self):
+        return {
+            'count':self.count,
+            'seconds':self.seconds,
+            'slowest':[{'seconds':seconds,'sql':sql} for seconds, sql in self.slowest]
+        }
+
+
+class ProfileStore:
+    '''
+    A bounded ring of captures on disk. Each capture is a pstats file that
+    snakeviz or pstats can open, and a JSON summary beside it; once there are
+    more than max_captures the oldest are removed.
+    '''
+    def __init__(self,directory,max_captures=50):
+        self.directory = directory
+        self.max_captures = max_captures
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def save(self,profile,summary):
+        with self._lock:
+            self._sequence += 1
+            name = str(int(time.time()*1000))+'_'+str(os.getpid())+'_'+str(self._sequence)
+        os.makedirs(self.directory,exist_ok=True)
+        profile.dump_stats(self.get_path(name,'.prof'))
+        summary['name'] = name
+        with open(self.get_path(name,'.json'),'w') as f:
+            json.dump(summary,f)
+        self.trim()
+        return name
+
+    def trim(self):
+        with self._lock:
+            for name in self.list()[self.max_captures:]:
+                for suffix in ('.prof','.json'):
+                    try:
+                        os.remove(self.get_path(name,suffix))
+                    except OSError:
+                        pass
+
+    def list(self):
+        # newest first
+        if not os.path.isdir(self.directory):
+            return []
+        names = [filename[:-5] for filename in os.listdir(self.directory) if filename.endswith('.json')]
+        return sorted((name for name in names if CAPTURE_NAME.match(name)),
+                      key=lambda name: [int(part) for part in name.split('_')],reverse=True)
+
+    def get_path(self,name,suffix):
+        if not CAPTURE_NAME.match(name):
+            raise ValueError("Not a capture name: "+name)
+        return os.path.join(self.directory,name+suffix)
+
+    def read_summary(self,name):
+        with open(self.get_path(name,'.json'),'r') as f:
+            return json.load(f)
+
+
+PROFILE_STORE = ProfileStore(settings.PROFILER_DIR,settings.PROFILER_MAX_CAPTURES)
+
+# tracemalloc is process wide, so only one request is profiled at a time
+_capture_lock = threading.Lock()
+
+
+class ProfilerMiddleware:
+    '''
+    Profiles single requests: those sent by a staff user with the
+    PROFILER_HEADER header, and PROFILER_SAMPLE_RATE of the requests to the
+    views named in PROFILER_VIEWS. A capture holds the cProfile stats, the
+    allocations still held when the view returned (tracemalloc) and the SQL
+    queries, and is downloadable from admin/profiles/.
+    '''
+    def __init__(self,get_response):
+        self.get_response = get_response
+        self.header = 'HTTP_'+settings.PROFILER_HEADER.upper().replace('-','_')
+
+    def __call__(self,request):
+        if not self.should_profile(request) or not _capture_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _capture_lock.release()
+
+    def requested_by_staff(self,request):
+        user = getattr(request,'user',None)
+        return bool(request.META.get(self.header)) and user is not None and user.is_active and user.is_staff
+
+    def should_profile(self,request):
+        if request.META.get(self.header):
+            return self.requested_by_staff(request)
+        rate = settings.PROFILER_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return False
+        try:
+            return resolve(request.path_info).url_name in settings.PROFILER_VIEWS
+        except Resolver404:
+            return False
+
+    def profile(self,request):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(settings.PROFILER_TRACEMALLOC_FRAMES)
+        queries = QueryRecorder()
+        profile = cProfile.Profile()
+        before = tracemalloc.take_snapshot()
+        start = time.monotonic()
+        try:
+            with connection.execute_wrapper(queries):
+                profile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profile.disable()
+            seconds = time.monotonic() - start
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        allocations = after.compare_to(before,'lineno')
+        stats = io.StringIO()
+        pstats.Stats(profile,stream=stats).sort_stats('cumulative').print_stats(30)
+        summary = {
+            'path':request.path,
+            'method':request.method,
+            'status':response.status_code,
+            'seconds':seconds,
+            'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pid':os.getpid(),
+            'sql':queries.as_dict(),
+            'allocated_bytes':sum(stat.size_diff for stat in allocations),
+            'allocations':[{'size_diff':stat.size_diff,'count_diff':stat.count_diff,'where':str(stat.traceback)}
+                           for stat in allocations[:20]],
+            'stats':stats.getvalue()
+        }
+        try:
+            name = PROFILE_STORE.save(profile,summary)
+        except OSError as e:
+            logger.warning("Could not store request profile: %s", e)
+            return response
+        logger.info("Profiled %s %s in %.4fs as %s", request.method, request.path, seconds, name)
+        # sampled requests may be anyone's, only staff who asked for the capture are told its name
+        if self.requested_by_staff(request):
+            response['X-Profile-Capture'] = name
+        return response
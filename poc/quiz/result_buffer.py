@@ -0,0 +1,219 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks on Windows, where the development server runs a single process anyway
+    fcntl = None
+
+from . models import *
+from . metrics import *
+
+logger = logging.getLogger(__name__)
+
+RESULT_FLUSH_SECONDS = Histogram('quiz_result_flush_seconds','Time taken to write a batch of queued results',
+                                 buckets=LATENCY_BUCKETS)
+
+
+class ResultBuffer:
+    '''
+    Collects Result rows in memory and writes them with bulk_create from a
+    background thread, either once batch_size rows are waiting or every
+    flush_interval seconds. Rows that cannot be written (database down, queue
+    full) are appended to spill_path as JSON lines and replayed on the next
+    successful flush. Every gunicorn worker shares spill_path, so appends and
+    replays hold a lock on spill_path.lock; lines that cannot be read back are
+    moved to spill_path.bad.
+    '''
+    def __init__(self,max_queue=10000,batch_size=50,flush_interval=2.0,spill_path='result_spill.jsonl',write_behind=True):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.write_behind = write_behind
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._write_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.flush_count = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def add(self,record):
+        if not self.write_behind:
+            record.save()
+            self.flushed += 1
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            logger.warning("Result buffer full, spilling record to %s", self.spill_path)
+            self._spill([record])
+
+    def flush(self):
+        # writes everything that is currently queued, used on shutdown
+        records = self._drain(None)
+        while records:
+            self._write(records)
+            records = self._drain(None)
+
+    def stats(self):
+        return {
+            'queue_depth':self._queue.qsize(),
+            'max_queue':self.max_queue,
+            'enqueued':self.enqueued,
+            'flushed':self.flushed,
+            'spilled':self.spilled,
+            'replayed':self.replayed,
+            'flush_count':self.flush_count,
+            'last_flush_seconds':self.last_flush_seconds,
+            'max_flush_seconds':self.max_flush_seconds,
+            'mean_flush_seconds':(self.total_flush_seconds/self.flush_count) if self.flush_count else 0.0
+        }
+
+    def _ensure_started(self):
+        # started lazily and per process, threads do not survive a gunicorn fork
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run,name='result-buffer',daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        # the thread must outlive any error, or the worker would queue results without ever writing them
+        records = []
+        try:
+            records = self._drain(self.flush_interval)
+            if records:
+                self._write(records)
+        except Exception:
+            logger.exception("Result buffer flush of %d records failed", len(records))
+
+    def _drain(self,timeout):
+        # blocks up to timeout for the first record, then takes whatever is waiting up to batch_size
+        records = []
+        try:
+            if timeout is None:
+                records.append(self._queue.get_nowait())
+            else:
+                records.append(self._queue.get(timeout=timeout))
+            while len(records) < self.batch_size:
+                records.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return records
+
+    def _write(self,records):
+        with self._write_lock:
+            start = time.monotonic()
+            try:
+                close_old_connections()
+                # all or nothing, a spilled batch must not be partly written already
+                with transaction.atomic():
+                    Result.objects.bulk_create(records)
+                self.flushed += len(records)
+            except Exception as e:
+                logger.error("Result flush failed, spilling %d records: %s", len(records), e)
+                self._spill(records)
+                return
+            finally:
+                elapsed = time.monotonic() - start
+                self.flush_count += 1
+                self.last_flush_seconds = elapsed
+                self.total_flush_seconds += elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds,elapsed)
+                RESULT_FLUSH_SECONDS.observe(elapsed)
+            self._replay_spill()
+
+    @contextmanager
+    def _spill_locked(self):
+        # the thread lock orders this worker's threads, the file lock the other workers
+        with self._spill_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.spill_path+'.lock','a') as lock:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock,fcntl.LOCK_UN)
+
+    def _spill(self,records):
+        lines = []
+        for record in records:
+            row = {}
+            for field in Result._meta.concrete_fields:
+                if field.attname != 'id':
+                    row[field.attname] = getattr(record,field.attname)
+            lines.append(json.dumps(row,default=str)+'\n')
+        with self._spill_locked():
+            with open(self.spill_path,'a') as f:
+                f.writelines(lines)
+            self.spilled += len(records)
+
+    def _replay_spill(self):
+        if not os.path.exists(self.spill_path):
+            return
+        # the file is only removed once every row is in, so a failed replay leaves nothing half written
+        with self._spill_locked():
+            try:
+                with open(self.spill_path,'r') as f:
+                    lines = [line for line in f if line.strip()]
+            except FileNotFoundError:
+                return
+            records = []
+            bad_lines = []
+            for line in lines:
+                try:
+                    records.append(Result(**json.loads(line)))
+                except (ValueError,TypeError):
+                    bad_lines.append(line if line.endswith('\n') else line+'\n')
+            try:
+                with transaction.atomic():
+                    Result.objects.bulk_create(records,batch_size=500)
+            except Exception as e:
+                logger.error("Replaying spilled results failed: %s", e)
+                return
+            if bad_lines:
+                logger.error("Moved %d unreadable spilled results to %s", len(bad_lines), self.spill_path+'.bad')
+                with open(self.spill_path+'.bad','a') as f:
+                    f.writelines(bad_lines)
+            os.remove(self.spill_path)
+        self.replayed += len(records)
+        logger.info("Replayed %d spilled results", len(records))
+
+
+RESULT_BUFFER = ResultBuffer(
+    max_queue=getattr(settings,'RESULT_BUFFER_MAX_QUEUE',10000),
+    batch_size=getattr(settings,'RESULT_BUFFER_BATCH_SIZE',50),
+    flush_interval=getattr(settings,'RESULT_BUFFER_FLUSH_INTERVAL',2.0),
+    spill_path=getattr(settings,'RESULT_BUFFER_SPILL_PATH','result_spill.jsonl'),
+    write_behind=getattr(settings,'RESULT_BUFFER_WRITE_BEHIND',True)
+)
+atexit.register(RESULT_BUFFER.flush)
@@ -0,0 +1,397 @@
+import os
+from fractions import Fraction
+
+import numpy as np
+
+
+def softmax(jll):
+    # normalizes joint log likelihoods row by row into probabilities
+    jll = jll - jll.max(axis=1, keepdims=True)
+    prob = np.exp(jll)
+    prob /= prob.sum(axis=1, keepdims=True)
+    return prob
+
+def sigmoid(scores):
+    return 1.0/(1.0+np.exp(-scores))
+
+def rank_classes(prediction,decimals=4):
+    # indices of the classes in descending order of (rounded) probability, ties keep class order
+    return np.argsort(-np.round(prediction,decimals),axis=1,kind='mergesort')
+
+
+class ScoringKernel:
+    '''
+    Scores an exported model with NumPy only. Every backend keeps its
+    parameters as a few named arrays (see arrays/from_arrays) so they can be
+    written to an .npz file or a model bundle and scored without sklearn.
+    '''
+    backend = None
+
+    def arrays(self):
+        raise NotImplementedError
+
+    @classmethod
+    def from_arrays(cls,arrays,classes):
+        raise NotImplementedError
+
+    @classmethod
+    def load(cls,path):
+        return load_kernel(path)
+
+    def save(self,path):
+        save_kernel(self,path)
+
+    def predict_proba(self,X):
+        raise NotImplementedError
+
+    def predict_proba_sparse(self,indices,values):
+        # a single encoded response given as its non-zero features
+        x = np.zeros(self.n_features)
+        x[np.asarray(indices,dtype=np.intp)] = values
+        return self.predict_proba(x)
+
+    def predict(self,X):
+        return self.classes_[np.argmax(self.predict_proba(X),axis=1)]
+
+
+class LinearKernel(ScoringKernel):
+    '''
+    Models whose class scores are linear in the features.
+
+    params holds the intercepts in row 0 and the transposed coefficients in
+    rows 1..n_features, so a batch is scored with a single dot product and one
+    encoded response with a gather and sum of its rows.
+    '''
+    def __init__(self,params,classes):
+        self.params = params
+        self.classes_ = classes
+        self.n_features = params.shape[0] - 1
+
+    def arrays(self):
+        return {'params':self.params}
+
+    @classmethod
+    def from_arrays(cls,arrays,classes):
+        return cls(arrays['params'],classes)
+
+    def decision_function(self,X):
+        X = np.atleast_2d(X)
+        return np.dot(X,self.params[1:]) + self.params[0]
+
+    def decision_function_sparse(self,indices,values):
+        # only the non-zero features of a single response contribute to the sum
+        rows = self.params[np.asarray(indices,dtype=np.intp)+1]
+        scores = self.params[0] + np.dot(np.asarray(values,dtype=np.float64),rows)
+        return scores.reshape(1,-1)
+
+    def link(self,scores):
+        raise NotImplementedError
+
+    def predict_proba(self,X):
+        return self.link(self.decision_function(X))
+
+    def predict_proba_sparse(self,indices,values):
+        return self.link(self.decision_function_sparse(indices,values))
+
+
+class NaiveBayesKernel(LinearKernel):
+    '''
+    A fitted MultinomialNB: class log priors as intercepts and feature log
+    probabilities as coefficients, normalized with a softmax.
+    '''
+    backend = 'nb'
+
+    @classmethod
+    def from_model(cls,model):
+        params = np.vstack([model.class_log_prior_,model.feature_log_prob_.T])
+        return cls(params,np.array(model.classes_))
+
+    def joint_log_likelihood(self,X):
+        return self.decision_function(X)
+
+    def joint_log_likelihood_sparse(self,indices,values):
+        return self.decision_function_sparse(indices,values)
+
+    def link(self,scores):
+        return softmax(scores)
+
+
+class LogisticRegressionKernel(LinearKernel):
+    '''
+    A fitted LogisticRegression. Multinomial models normalize the class scores
+    with a softmax; one-vs-rest models take the sigmoid of each class score and
+    rescale them to sum to one, as sklearn does.
+    '''
+    backend = 'lr'
+
+    def __init__(self,params,classes,multinomial=False):
+        super().__init__(params,classes)
+        self.multinomial = bool(multinomial)
+
+    def arrays(self):
+        return {'params':self.params,'multinomial':np.array(self.multinomial)}
+
+    @classmethod
+    def from_arrays(cls,arrays,classes):
+        return cls(arrays['params'],classes,arrays['multinomial'])
+
+    @classmethod
+    def from_model(cls,model):
+        params = np.vstack([model.intercept_,model.coef_.T])
+        multi_class = getattr(model,'multi_class','ovr')
+        if multi_class == 'auto':
+            multi_class = 'ovr' if model.solver == 'liblinear' or len(model.classes_) <= 2 else 'multinomial'
+        return cls(params,np.array(model.classes_),multi_class == 'multinomial')
+
+    def link(self,scores):
+        if scores.shape[1] == 1:
+            prob = sigmoid(scores)
+            return np.hstack([1-prob,prob])
+        if self.multinomial:
+            return softmax(scores)
+        prob = sigmoid(scores)
+        prob /= prob.sum(axis=1, keepdims=True)
+        return prob
+
+
+class DecisionTreeKernel(ScoringKernel):
+    '''
+    A fitted DecisionTreeClassifier as flat node arrays. A batch walks down the
+    tree together, one level per step, and takes the class distribution of
+    the leaf each row ends in.
+    '''
+    backend = 'dt'
+
+    def __init__(self,children_left,children_right,feature,threshold,value,classes,n_features):
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.classes_ = classes
+        self.n_features = int(n_features)
+
+    def arrays(self):
+        return {
+            'children_left':self.children_left,
+            'children_right':self.children_right,
+            'feature':self.feature,
+            'threshold':self.threshold,
+            'value':self.value,
+            'n_features':np.array(self.n_features)
+        }
+
+    @classmethod
+    def from_arrays(cls,arrays,classes):
+        return cls(arrays['children_left'],arrays['children_right'],arrays['feature'],
+                   arrays['threshold'],arrays['value'],classes,arrays['n_features'])
+
+    @classmethod
+    def from_model(cls,model):
+        tree = model.tree_
+        value = tree.value[:,0,:]
+        value = value/value.sum(axis=1, keepdims=True)
+        n_features = getattr(model,'n_features_in_',getattr(model,'n_features_',None))
+        return cls(tree.children_left.astype(np.int64),tree.children_right.astype(np.int64),
+                   tree.feature.astype(np.int64),tree.threshold,value,np.array(model.classes_),n_features)
+
+    def apply(self,X):
+        # sklearn compares float32 features with the float64 thresholds
+        X = np.atleast_2d(X).astype(np.float32)
+        if X.shape[0] == 1:
+            # a single response is cheaper to walk node by node than level by level
+            x = X[0]
+            node = 0
+            while self.children_left[node] != -1:
+                if x[self.feature[node]] <= self.threshold[node]:
+                    node = self.children_left[node]
+                else:
+                    node = self.children_right[node]
+            return np.array([node],dtype=np.intp)
+        rows = np.arange(X.shape[0])
+        node = np.zeros(X.shape[0],dtype=np.intp)
+        left = self.children_left[node]
+        while True:
+            split = left != -1
+            if not split.any():
+                return node
+            go_left = X[rows,self.feature[node]] <= self.threshold[node]
+            node = np.where(split,np.where(go_left,left,self.children_right[node]),node)
+            left = self.children_left[node]
+
+    def predict_proba(self,X):
+        return self.value[self.apply(X)]
+
+
+class EnsembleKernel(ScoringKernel):
+    '''
+    Weighted blend of member kernels trained on the same encoded features.
+
+    The parameters of the linear members are stacked side by side, so one dot
+    product (or one gather and sum for a single response) scores all of them;
+    each member's link is then applied to its own block of columns. Trees are
+    walked separately. weights are learned offline by build_model.py.
+    '''
+    backend = 'ens'
+
+    def __init__(self,members,weights,classes):
+        self.members = list(members)
+        self.weights = np.asarray(weights,dtype=np.float64)
+        self.classes_ = classes
+        self.n_features = self.members[0].n_features
+        for member in self.members:
+            if member.n_features != self.n_features or not np.array_equal(member.classes_,classes):
+                raise ValueError("Ensemble members must share their features and classes")
+        self._linear = [i for i, member in enumerate(self.members) if isinstance(member,LinearKernel)]
+        self._stacked = None
+        if self._linear:
+            self._stacked = np.hstack([self.members[i].params for i in self._linear])
+
+    def arrays(self):
+        arrays = {
+            'weights':self.weights,
+            'member_backends':np.array([member.backend for member in self.members])
+        }
+        for i, member in enumerate(self.members):
+            for name, array in member.arrays().items():
+                arrays['member'+str(i)+'_'+name] = array
+        return arrays
+
+    @classmethod
+    def from_arrays(cls,arrays,classes):
+        members = []
+        for i, backend in enumerate(arrays['member_backends']):
+            prefix = 'member'+str(i)+'_'
+            member_arrays = {name[len(prefix):]:array for name, array in arrays.items() if name.startswith(prefix)}
+            members.append(kernel_from_arrays(str(backend),member_arrays,classes))
+        return cls(members,arrays['weights'],classes)
+
+    def _blend(self,scores,X):
+        # scores holds the stacked linear class scores, X is only read by the other members
+        n_classes = len(self.classes_)
+        blended = np.zeros((scores.shape[0] if scores is not None else X.shape[0],n_classes))
+        for j, i in enumerate(self._linear):
+            blended += self.weights[i]*self.members[i].link(scores[:,j*n_classes:(j+1)*n_classes])
+        for i, member in enumerate(self.members):
+            if i not in self._linear:
+                blended += self.weights[i]*member.predict_proba(X)
+        return blended
+
+    def predict_proba(self,X):
+        X = np.atleast_2d(X)
+        scores = None
+        if self._stacked is not None:
+            scores = np.dot(X,self._stacked[1:]) + self._stacked[0]
+        return self._blend(scores,X)
+
+    def predict_proba_sparse(self,indices,values):
+        indices = np.asarray(indices,dtype=np.intp)
+        scores = None
+        if self._stacked is not None:
+            scores = self._stacked[0] + np.dot(np.asarray(values,dtype=np.float64),self._stacked[indices+1])
+            scores = scores.reshape(1,-1)
+        x = None
+        if len(self._linear) < len(self.members):
+            x = np.zeros((1,self.n_features))
+            x[0,indices] = values
+        return self._blend(scores,x)
+
+
+BACKENDS = {
+    NaiveBayesKernel.backend:NaiveBayesKernel,
+    LogisticRegressionKernel.backend:LogisticRegressionKernel,
+    DecisionTreeKernel.backend:DecisionTreeKernel,
+    EnsembleKernel.backend:EnsembleKernel
+}
+
+MODEL_BACKENDS = {
+    'MultinomialNB':NaiveBayesKernel.backend,
+    'LogisticRegression':LogisticRegressionKernel.backend,
+    'DecisionTreeClassifier':DecisionTreeKernel.backend
+}
+
+def kernel_from_model(model):
+    if isinstance(model,ScoringKernel):
+        # ensembles are assembled from kernels in build_model.py and are already one
+        return model
+    name = type(model).__name__
+    if name not in MODEL_BACKENDS:
+        raise ValueError("No scoring backend for "+name)
+    return BACKENDS[MODEL_BACKENDS[name]].from_model(model)
+
+def kernel_from_arrays(backend,arrays,classes):
+    return BACKENDS[backend].from_arrays(arrays,classes)
+
+def get_kernel_path(directory,model_name,backend):
+    return directory+model_name+'_'+backend+'.npz'
+
+def find_kernel_path(directory,model_name):
+    for backend in BACKENDS:
+        path = get_kernel_path(directory,model_name,backend)
+        if os.path.exists(path):
+            return path
+    return None
+
+def save_kernel(kernel,path):
+    with open(path,'wb') as f:
+        np.savez(f,backend=np.array(kernel.backend),classes=kernel.classes_,**kernel.arrays())
+
+def load_kernel(path):
+    with np.load(path) as data:
+        # files exported before there were several backends only hold a naive bayes kernel
+        backend = str(data['backend']) if 'backend' in data.files else NaiveBayesKernel.backend
+        arrays = {name:data[name] for name in data.files if name not in ('backend','classes')}
+        return kernel_from_arrays(backend,arrays,data['classes'])
+
+def export_kernel(model,directory,model_name):
+    kernel = kernel_from_model(model)
+    save_kernel(kernel,get_kernel_path(directory,model_name,kernel.backend))
+    return kernel
+
+
+# evaluation of a model on a labelled test set, used by build_model.py and score_models.py
+TOP_K = (1,3,5)
+
+def get_actual_ranks(classes,ranking,actual):
+    # 0 based rank of every row's program, len(classes) for a program the model never saw
+    hits = classes[ranking] == np.asarray(actual).reshape(-1,1)
+    return np.where(hits.any(axis=1),hits.argmax(axis=1),len(classes))
+
+def get_mean_reciprocal_rank(ranks,cutoff):
+    # mean of 1/(rank+1) over the rows ranked within cutoff (others count 0), summed exactly from the
+    # count of every rank so it is the mean statistics.mean gave on the per row scores
+    counts = np.bincount(ranks,minlength=cutoff)[:cutoff]
+    total = sum(int(count)*Fraction(1/(rank+1.0)) for rank, count in enumerate(counts))
+    return float(total/len(ranks))
+
+def get_confusion_matrix(classes,actual,predicted):
+    # rows are the actual programs and columns the predicted ones, both in the order of classes
+    actual_index = np.searchsorted(classes,actual)
+    known = (actual_index < len(classes)) & (classes[np.minimum(actual_index,len(classes)-1)] == actual)
+    confusion = np.zeros((len(classes),len(classes)),dtype=np.int64)
+    np.add.at(confusion,(actual_index[known],predicted[known]),1)
+    return confusion
+
+def evaluate_model(model,test_array,test_actual,top_k=TOP_K):
+    '''
+    Scores a model (or kernel) on a whole test set from one predict_proba
+    call: accuracy of the most likely program, the top_k hit rates, t3 (the
+    reciprocal rank when the program is in the top 3, else 0), rr (the mean
+    reciprocal rank) and the confusion matrix. Ranks follow rank_classes, the
+    order the quiz shows programs in.
+    '''
+    classes = np.asarray(model.classes_)
+    test_actual = np.asarray(test_actual)
+    probabilities = model.predict_proba(test_array)
+    predicted = probabilities.argmax(axis=1)
+    ranks = get_actual_ranks(classes,rank_classes(probabilities),test_actual)
+
+    scores = {
+        'accuracy':np.count_nonzero(classes[predicted] == test_actual)/float(len(test_actual)),
+        't3':get_mean_reciprocal_rank(ranks,3),
+        'rr':get_mean_reciprocal_rank(ranks,len(classes)),
+        'confusion':get_confusion_matrix(classes,test_actual,predicted)
+    }
+    for k in top_k:
+        scores['top_'+str(k)] = np.count_nonzero(ranks < k)/float(len(test_actual))
+    return scores
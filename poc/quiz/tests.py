@@ -1,3 +1,635 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from prometheus_client import REGISTRY
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . activate_model import MODEL_NAME
+from . benchmark import compare_to_baseline, summarize_latencies
+from . bundle import ModelBundle, write_bundle
+from . content import get_content_snapshot, invalidate_content_snapshot
+from . dataset_cache import get_dataset_key
+from . dictionaries import *
+from . data_load import (balance_data, get_answer_categories, get_clean_data, get_cleaning_params, get_encoded_dict,
+                         get_industry_flags, get_label_encoded_data, transform_post_dict)
+from . inference import get_prediction, get_prediction_key, get_routed_prediction, get_shadow_prediction
+from . management.commands.benchmark_submit import is_recommendations_page, load_submit_payloads
+from . model_registry import get_loaded_model
+from . model_router import ModelRouter
+from . models import *
+from . prediction_cache import PREDICTION_CACHE
+from . profiler import PROFILE_STORE
+from . result_buffer import RESULT_BUFFER, ResultBuffer
+from . scoring import EnsembleKernel, evaluate_model, kernel_from_arrays, kernel_from_model
+from . warmup import WARMUP_STATE, warm_up_model
+
+ANSWERS = {
+    'creative':'creative',
+    'outdoors':'limited',
+    'career':'programming',
+    'group_work':'yes',
+    'liked_courses':'math',
+    'disliked_courses':'history',
+    'join_clubs':'robotics',
+    'not_clubs':'business',
+    'liked_projects':'robot',
+    'disliked_projects':'olympic_village',
+    'alternate_degree':'cs',
+    'drawing':'bad',
+    'essay':'no',
+    'industry':['technology','automotive']
+}
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProgramPageQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        first_year = CourseType.objects.create(option='First Year Course')
+        upper_year = CourseType.objects.create(option='Upper Year Course')
+        co_op = CareerType.objects.create(option='Sample Co-op Job')
+        full_time = CareerType.objects.create(option='Sample Full-Time Job')
+        recommendations = []
+        for name, code in READ_PROGRAMS.items():
+            program = Program.objects.create(name=name)
+            recommendations.append(Recommendation.objects.create(program=program,code=code))
+        for i, recommendation in enumerate(recommendations):
+            code = recommendation.code
+            Description.objects.create(program=recommendation,description='About '+code,hyperlink='https://uwaterloo.ca/'+code)
+            Course.objects.create(program=recommendation,course_type=first_year,course='First year '+code)
+            Course.objects.create(program=recommendation,course_type=upper_year,course='Upper year '+code)
+            Career.objects.create(program=recommendation,career_type=co_op,career='Co-op '+code)
+            Career.objects.create(program=recommendation,career_type=full_time,career='Full-time '+code)
+            other = recommendations[(i+1)%len(recommendations)]
+            Comparison.objects.create(program_1=recommendation.program,program_2=other.program,comparison=code+' vs '+other.code,recommendation=recommendation)
+
+    def setUp(self):
+        cache.clear()
+        invalidate_content_snapshot()
+
+    def test_programs_page_query_budget(self):
+        # one query each for recommendations, descriptions, courses, careers and comparisons
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('programs'))
+        self.assertEqual(response.status_code,200)
+        self.assertContains(response,'Upper year swe')
+        self.assertContains(response,'Full-time nano')
+        self.assertContains(response,'geo vs env')
+        # later renders come from the snapshot
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('programs'))
+        self.assertContains(response,'Upper year swe')
+
+    def test_recommendations_page_query_budget(self):
+        # only the Result insert once the snapshot is built
+        get_content_snapshot()
+        with mock.patch.object(RESULT_BUFFER,'write_behind',False):
+            with self.assertNumQueries(1):
+                response = self.client.post(reverse('submit'),ANSWERS)
+        self.assertEqual(response.status_code,200)
+        self.assertContains(response,'First year ce')
+        self.assertTrue(is_recommendations_page(response.status_code,response.content))
+        self.assertEqual(Result.objects.count(),1)
+
+    def test_submit_stages_are_exported(self):
+        def count(name,labels):
+            return REGISTRY.get_sample_value(name,labels) or 0
+        stages = ['transform','encode','db_write','context','render']
+        before = {stage:count('quiz_stage_seconds_count',{'view':'submit','stage':stage}) for stage in stages}
+        requests = count('quiz_requests_total',{'view':'submit','status':'200'})
+        with mock.patch.object(RESULT_BUFFER,'write_behind',False):
+            self.client.post(reverse('submit'),ANSWERS)
+        for stage in stages:
+            self.assertEqual(count('quiz_stage_seconds_count',{'view':'submit','stage':stage}),before[stage]+1)
+        self.assertEqual(count('quiz_requests_total',{'view':'submit','status':'200'}),requests+1)
+
+        errors = count('quiz_request_errors_total',{'view':'submit'})
+        answers = dict(ANSWERS)
+        del answers['industry']
+        self.client.post(reverse('submit'),answers)
+        self.assertEqual(count('quiz_request_errors_total',{'view':'submit'}),errors+1)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code,200)
+        self.assertContains(response,'quiz_stage_seconds_bucket')
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code,403)
+            response = self.client.get(reverse('metrics'),HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code,200)
+
+    def test_staff_header_profiles_request(self):
+        User.objects.create_user('staff',password='pw',is_staff=True)
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(PROFILE_STORE,'directory',directory):
+            response = self.client.get(reverse('programs'),HTTP_X_PROFILE='1')
+            self.assertNotIn('X-Profile-Capture',response)
+            self.client.login(username='staff',password='pw')
+            invalidate_content_snapshot()
+            response = self.client.get(reverse('programs'),HTTP_X_PROFILE='1')
+            name = response['X-Profile-Capture']
+            captures = self.client.get(reverse('profileCaptures')).json()['captures']
+            self.assertEqual([capture['name'] for capture in captures],[name])
+            self.assertEqual(captures[0]['sql_queries'],5)
+            response = self.client.get(captures[0]['profile'])
+            self.assertEqual(response.status_code,200)
+            self.assertTrue(b''.join(response.streaming_content))
+            self.client.logout()
+            self.assertEqual(self.client.get(captures[0]['profile']).status_code,302)
+
+    def test_sampled_profiles_are_not_announced(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(PROFILE_STORE,'directory',directory):
+            with override_settings(PROFILER_SAMPLE_RATE=1.0,PROFILER_VIEWS=['programs']):
+                response = self.client.get(reverse('programs'))
+            self.assertNotIn('X-Profile-Capture',response)
+            self.assertEqual(len(PROFILE_STORE.list()),1)
+
+    def test_content_change_rebuilds_snapshot(self):
+        snapshot = get_content_snapshot()
+        self.assertIs(get_content_snapshot(),snapshot)
+        course = Course.objects.get(course='Upper year swe')
+        course.course = 'Upper year swe (revised)'
+        course.save()
+        rebuilt = get_content_snapshot()
+        self.assertIsNot(rebuilt,snapshot)
+        self.assertEqual(rebuilt.programs['swe'].courses['upper_year_course'][0].course,'Upper year swe (revised)')
+        Comparison.objects.filter(recommendation__code='geo').delete()
+        self.assertEqual(get_content_snapshot().programs['geo'].comparisons,())
+
+    def test_pages_answer_conditional_requests(self):
+        for name in ['home','about','programs']:
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code,200)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(name),HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code,304)
+
+    def test_content_change_refreshes_cached_pages(self):
+        etag = self.client.get(reverse('programs'))['ETag']
+        recommendation = Recommendation.objects.get(code='nano')
+        Description.objects.create(program=recommendation,description='Revised nano description',hyperlink='https://uwaterloo.ca/nano')
+        response = self.client.get(reverse('programs'),HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code,200)
+        self.assertNotEqual(response['ETag'],etag)
+        self.assertContains(response,'Revised nano description')
+        with mock.patch.object(RESULT_BUFFER,'write_behind',False):
+            response = self.client.post(reverse('submit'),ANSWERS)
+        self.assertContains(response,'Revised nano description')
+
+
+    def test_snapshot_rebuild_refreshes_cached_pages(self):
+        # an edit saved by another worker only reaches this one's local cache through the snapshot max age
+        self.client.get(reverse('programs'))
+        recommendation = Recommendation.objects.get(code='nano')
+        Description.objects.bulk_create([Description(program=recommendation,description='Edited elsewhere',hyperlink='https://uwaterloo.ca/nano')])
+        self.assertNotContains(self.client.get(reverse('programs')),'Edited elsewhere')
+        with override_settings(CONTENT_SNAPSHOT_MAX_AGE=0):
+            self.assertContains(self.client.get(reverse('programs')),'Edited elsewhere')
+            with mock.patch.object(RESULT_BUFFER,'write_behind',False):
+                self.assertContains(self.client.post(reverse('submit'),ANSWERS),'Edited elsewhere')
+
+
+class ReadinessTests(TestCase):
+    def test_ready_after_warm_up(self):
+        with mock.patch.object(WARMUP_STATE,'ready',False):
+            response = self.client.get(reverse('readiness'))
+            self.assertEqual(response.status_code,503)
+            self.assertTrue(warm_up_model())
+            response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code,200)
+        self.assertTrue(response.json()['ready'])
+
+
+@override_settings(BATCH_SCORING_TOKEN='secret')
+class BatchSubmitTests(TestCase):
+    def post_batch(self,body,token='secret'):
+        return self.client.post(reverse('batchSubmit'),json.dumps(body),content_type='application/json',
+                                HTTP_AUTHORIZATION='Bearer '+token)
+
+    def test_batch_is_scored_and_stored(self):
+        response = self.post_batch({'responses':[ANSWERS,dict(ANSWERS,creative='not_creative')]})
+        self.assertEqual(response.status_code,200)
+        self.assertEqual(len(response.json()['results']),2)
+        self.assertEqual(len(response.json()['results'][0]['programs']),len(READ_PROGRAMS))
+        self.assertEqual(Result.objects.count(),2)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.post_batch({'responses':[ANSWERS]},token='wrong').status_code,403)
+        with self.settings(BATCH_SCORING_TOKEN=''):
+            self.assertEqual(self.post_batch({'responses':[ANSWERS]}).status_code,403)
+        self.assertEqual(Result.objects.count(),0)
+
+    def test_malformed_batches_are_rejected(self):
+        malformed = [
+            {'answers':[ANSWERS]},
+            {'responses':ANSWERS},
+            {'responses':['creative']},
+            {'responses':[dict(ANSWERS,creative={'a':1})]},
+            {'responses':[dict(ANSWERS,industry=[1])]},
+            {'responses':[dict(ANSWERS,creative=[])]},
+            {'responses':[dict(ANSWERS,creative='unknown')]},
+            {'responses':[{key:value for key, value in ANSWERS.items() if key != 'essay'}]}
+        ]
+        for body in malformed:
+            self.assertEqual(self.post_batch(body).status_code,400,body)
+        with self.settings(BATCH_SCORING_MAX_RESPONSES=1):
+            self.assertEqual(self.post_batch({'responses':[ANSWERS,ANSWERS]}).status_code,400)
+        self.assertEqual(Result.objects.count(),0)
+
+
+class ModelRouterTests(TestCase):
+    def test_split_buckets_answer_hashes(self):
+        router = ModelRouter('primary',{'candidate':0.25})
+        self.assertEqual(router.choose('00000000'+'0'*32),'candidate')
+        self.assertEqual(router.choose('3fffffff'+'0'*32),'candidate')
+        self.assertEqual(router.choose('40000000'+'0'*32),'primary')
+        self.assertEqual(router.choose('f'*40),'primary')
+        with self.assertRaises(ValueError):
+            ModelRouter('primary',{'a':0.6,'b':0.5})
+
+    def test_failed_candidate_falls_back_to_primary(self):
+        router = ModelRouter(MODEL_NAME,{'candidate':1.0})
+        served = ({'mech':1.0},['mech'])
+
+        def score(post_dict,model_name):
+            if model_name == 'candidate':
+                raise RuntimeError('candidate is broken')
+            return served
+        with mock.patch('poc.quiz.inference.MODEL_ROUTER',router), mock.patch('poc.quiz.inference.get_prediction',side_effect=score):
+            self.assertEqual(get_routed_prediction({},'candidate'),(MODEL_NAME,)+served)
+        self.assertEqual(router.serving['candidate'].errors,1)
+        self.assertEqual(router.serving[MODEL_NAME].errors,0)
+
+    def test_api_etag_follows_the_served_model(self):
+        router = ModelRouter(MODEL_NAME,{'candidate':1.0})
+        primary_key = get_prediction_key(transform_post_dict({key:value if isinstance(value,list) else [value] for key, value in ANSWERS.items()}))
+        # the candidate has no files, so it cannot even be keyed
+        with mock.patch('poc.quiz.inference.MODEL_ROUTER',router):
+            response = self.client.get(reverse('recommendationsApi'),ANSWERS)
+        self.assertEqual(response.status_code,200)
+        self.assertEqual(response.json()['model'],MODEL_NAME)
+        self.assertEqual(response['ETag'],'"'+primary_key+'"')
+        self.assertEqual(router.serving['candidate'].errors,1)
+
+        # the candidate is keyed but fails while scoring
+        real_key = get_prediction_key
+
+        def key(post_dict,model_name=MODEL_NAME):
+            return 'candidate' if model_name == 'candidate' else real_key(post_dict,model_name)
+
+        def score(post_dict,model_name=MODEL_NAME,use_cache=True):
+            if model_name == 'candidate':
+                raise RuntimeError('candidate is broken')
+            return get_prediction(post_dict,model_name,use_cache)
+        with mock.patch('poc.quiz.inference.MODEL_ROUTER',router), mock.patch('poc.quiz.inference.get_prediction_key',side_effect=key), \
+                mock.patch('poc.quiz.inference.get_prediction',side_effect=score):
+            response = self.client.get(reverse('recommendationsApi'),ANSWERS)
+        self.assertEqual(response.json()['model'],MODEL_NAME)
+        self.assertEqual(response['ETag'],'"'+primary_key+'"')
+
+    def test_unknown_answers_are_not_model_errors(self):
+        router = ModelRouter(MODEL_NAME,{'candidate':1.0})
+        with mock.patch('poc.quiz.inference.MODEL_ROUTER',router), mock.patch('poc.quiz.inference.get_prediction',side_effect=KeyError('creative')):
+            with self.assertRaises(KeyError):
+                get_routed_prediction({},'candidate')
+        self.assertEqual(router.stats()['serving'],{})
+
+    def test_shadow_scoring_is_bounded_and_uncached(self):
+        router = ModelRouter(MODEL_NAME,shadow_models=['first','second'],max_pending=1)
+        release = threading.Event()
+
+        def score(post_dict,model_name):
+            release.wait(5)
+            return ({},['mech'])
+        router.shadow(score,{},MODEL_NAME,['mech'])
+        self.assertEqual(router.shadow_dropped,1)
+        release.set()
+        router._get_executor().shutdown(wait=True)
+        self.assertEqual(router.shadow_stats['first'].top1_agreements,1)
+
+        post_dict = transform_post_dict({key:value if isinstance(value,list) else [value] for key, value in ANSWERS.items()})
+        before = PREDICTION_CACHE.stats()
+        get_shadow_prediction(post_dict,MODEL_NAME)
+        after = PREDICTION_CACHE.stats()
+        self.assertEqual((after['hits'],after['misses'],after['size']),(before['hits'],before['misses'],before['size']))
+
+
+class ResultBufferTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.directory.name,'spill.jsonl')
+        self.buffer = ResultBuffer(spill_path=self.spill_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_spilled_results_are_replayed_once(self):
+        scores = {field.attname:'0.0' for field in Result._meta.concrete_fields if field.default is None}
+        self.buffer._spill([Result(model_name='spilled',time=str(i),**scores) for i in range(3)])
+        with open(self.spill_path,'a') as f:
+            f.write('{"model_name": "torn')
+        with mock.patch.object(Result.objects,'bulk_create',side_effect=RuntimeError('database down')):
+            self.buffer._replay_spill()
+        self.assertEqual(Result.objects.count(),0)
+
+        self.buffer._replay_spill()
+        self.buffer._replay_spill()
+        self.assertEqual(Result.objects.filter(model_name='spilled').count(),3)
+        self.assertFalse(os.path.exists(self.spill_path))
+        with open(self.spill_path+'.bad','r') as f:
+            self.assertEqual(f.read(),'{"model_name": "torn\n')
+
+    def test_flush_thread_survives_errors(self):
+        self.buffer._queue.put(Result(model_name='queued'))
+        with mock.patch.object(self.buffer,'_write',side_effect=FileNotFoundError('spill.jsonl')):
+            with self.assertLogs('poc.quiz.result_buffer','ERROR'):
+                self.buffer._flush_pending()
+
+
+class BenchmarkTests(TestCase):
+    def test_survey_rows_become_submissions(self):
+        payloads = load_submit_payloads('poc/quiz/exported_model_files/t7.csv')
+        self.assertGreater(len(payloads),100)
+        for payload in payloads:
+            self.assertEqual(set(payload),set(ANSWERS))
+            results_dict, results = get_prediction(transform_post_dict(payload))
+            self.assertEqual(len(results),len(READ_PROGRAMS))
+
+    def test_refuses_shared_database(self):
+        from django.core.management import CommandError, call_command
+        from django.db import connections
+        remote = {'ENGINE':'django.db.backends.postgresql','HOST':'ec2-1-2-3-4.compute-1.amazonaws.com'}
+        with mock.patch.dict(connections['default'].settings_dict,remote):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_submit','--requests','1','--target','client')
+        self.assertEqual(Result.objects.count(),0)
+
+    def test_error_page_is_not_a_success(self):
+        # without program content every submission fails in recommendations and submit still answers 200
+        invalidate_content_snapshot()
+        with mock.patch.object(RESULT_BUFFER,'write_behind',False):
+            response = self.client.post(reverse('submit'),ANSWERS)
+        self.assertEqual(response.status_code,200)
+        self.assertFalse(is_recommendations_page(response.status_code,response.content))
+
+    def test_regressions_are_reported(self):
+        baseline = [dict(summarize_latencies([0.010]*100,1.0),target='client',concurrency=1)]
+        similar = [dict(summarize_latencies([0.011]*100,1.1),target='client',concurrency=1)]
+        slower = [dict(summarize_latencies([0.010]*90+[0.020]*10,1.5),target='client',concurrency=1)]
+        self.assertEqual(compare_to_baseline(similar,baseline,('target','concurrency'),('p50_ms','p95_ms'),('throughput',)),[])
+        regressions = compare_to_baseline(slower,baseline,('target','concurrency'),('p50_ms','p95_ms'),('throughput',))
+        self.assertEqual([metric for key, metric, previous, current in regressions],['p95_ms','throughput'])
+
+
+def get_industry_flags_by_row(industry):
+    # the row by row parsing get_industry_flags replaced, kept to check it gives the same flags
+    import pandas as pd
+    industry_data = industry.str.split(";", expand = True)
+    industry_data = industry_data.replace(READ_INDUSTRY)
+    binary_industry_data = np.array([np.arange(len(industry))]*8).T
+    binary_industry_data = pd.DataFrame(binary_industry_data, columns=READ_INDUSTRY.values())
+    for col in binary_industry_data.columns:
+        binary_industry_data[col].values[:] = '0'
+    for index, row in industry_data.reset_index(drop=True).iterrows():
+        for i in range(8):
+            try:
+                binary_industry_data.iloc[int(index), binary_industry_data.columns.get_loc(row[i])] = '1'
+            except:
+                error = "None_Type detected"
+    binary_industry_data.index = industry.index
+    return binary_industry_data
+
+
+class IndustryParsingTests(TestCase):
+    def test_industry_flags_match_row_by_row_parsing(self):
+        import pandas as pd
+        for path in ['poc/quiz/quiz_data_.csv','poc/quiz/exported_model_files/d0.csv','poc/quiz/exported_model_files/t7.csv']:
+            industry = pd.read_csv(path,dtype=str).iloc[:,8]
+            expected = get_industry_flags_by_row(industry)
+            flags = get_industry_flags(industry)
+            self.assertEqual(list(flags.columns),list(READ_INDUSTRY.values()))
+            self.assertTrue(flags.index.equals(expected.index))
+            # the row by row version left the unpicked industries as the integer 0
+            self.assertTrue((flags.values == expected.astype(str).values).all(),path)
+
+            data = get_clean_data(path,'H',use_cache=False)
+            self.assertEqual(list(data.columns[-8:]),list(READ_INDUSTRY.values()))
+            self.assertNotIn('industry',data.columns)
+            self.assertEqual(data.index.name,'id')
+
+    def test_unknown_and_missing_answers_have_no_flags(self):
+        import pandas as pd
+        industry = pd.Series(['Health (i.e. Creating technology for minimally invasive surgeries);Other',np.nan,''])
+        flags = get_industry_flags(industry)
+        self.assertEqual(flags.loc[0].tolist(),['0','0','0','0','1','0','0','0'])
+        self.assertEqual(flags.loc[1].tolist(),['0']*8)
+        self.assertEqual(flags.loc[2].tolist(),['0']*8)
+
+
+def balance_data_by_doubling(data,data_balance):
+    # the balancing balance_data replaced: each program's frame doubled until it is long enough, then cut
+    import pandas as pd
+    b_df = data.head(0)
+    for program in READ_PROGRAMS.values():
+        temp_df = data.copy()[data.program==program]
+        while len(temp_df) <= data_balance[program]:
+            temp_df = pd.concat([temp_df,temp_df])
+        temp_df = temp_df.head(data_balance[program])
+        b_df = pd.concat([b_df,temp_df]).reset_index(drop=True)
+    return b_df
+
+
+class BalanceTests(TestCase):
+    def test_balancing_matches_doubling(self):
+        data = get_clean_data('poc/quiz/exported_model_files/d0.csv','H',use_cache=False)
+        targets = {program:100 for program in READ_PROGRAMS.values()}
+        targets['ce'] = 40
+        targets['swe'] = 3
+        balanced = balance_data(data,targets)
+        self.assertTrue(balanced.equals(balance_data_by_doubling(data,targets)))
+        self.assertEqual(balanced.program.value_counts().to_dict(),targets)
+
+    def test_seeded_balancing_is_deterministic(self):
+        data = get_clean_data('poc/quiz/exported_model_files/d0.csv','H',use_cache=False)
+        targets = {program:50 for program in READ_PROGRAMS.values()}
+        first = balance_data(data,targets,seed=7)
+        self.assertTrue(first.equals(balance_data(data,targets,seed=7)))
+        self.assertFalse(first.equals(balance_data(data,targets,seed=8)))
+        self.assertFalse(first.equals(balance_data(data,targets)))
+        self.assertEqual(first.program.value_counts().to_dict(),targets)
+
+
+def label_encode_by_column(data):
+    # the per column LabelEncoder fits the categorical codes replaced, kept to check they number answers the same
+    from sklearn import preprocessing
+    encoded = data.copy()
+    for col in encoded.columns:
+        encoded[col] = preprocessing.LabelEncoder().fit_transform(encoded[col].astype(str))
+    return encoded
+
+
+class BuildDirectoryTestCase(TestCase):
+    # the build functions write under poc/quiz/ of the working directory, these tests run in a temporary one
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name,'poc','quiz','exported_model_files'))
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+
+class LabelEncodingTests(BuildDirectoryTestCase):
+    def test_codes_match_label_encoder(self):
+        path = os.path.join(self.cwd,'poc/quiz/exported_model_files/d0.csv')
+        columns = list(get_clean_data(path,'H').columns)
+        encoded = get_label_encoded_data(path,'test',columns)[0]
+        expected = label_encode_by_column(get_clean_data(path,'H'))
+        self.assertEqual(set(encoded.dtypes),{np.dtype('int8')})
+        self.assertTrue((encoded.values == expected.values).all())
+
+    def test_codes_do_not_depend_on_answers_seen(self):
+        import pandas as pd
+        path = os.path.join(self.cwd,'poc/quiz/exported_model_files/t7.csv')
+        few = os.path.join(self.directory.name,'few.csv')
+        pd.read_csv(path,dtype=str).head(5).to_csv(few,index=False)
+        columns = ['program','creative','join_clubs','technology']
+        clean = get_clean_data(few,'H')
+        encoded = get_label_encoded_data(few,'test',columns)[0]
+        for col in columns:
+            categories = get_answer_categories(col)
+            self.assertEqual(list(encoded[col]),[categories.index(answer) for answer in clean[col]])
+
+        # one dictionary file holding every answer, and the per column files of older models still read
+        encoded_dict = get_encoded_dict('test')
+        self.assertEqual(encoded_dict['program']['program'],{program:INDEX_PROGRAM[program] for program in READ_PROGRAMS.values()})
+        os.remove('poc/quiz/exported_model_files/test_encoded_dictionary.json')
+        for col in columns:
+            with open('poc/quiz/exported_model_files/test_'+col+'_encoded_dictionary.json','w') as f:
+                json.dump(encoded_dict[col],f)
+        self.assertEqual(get_encoded_dict('test'),encoded_dict)
+
+
+class DatasetCacheTests(BuildDirectoryTestCase):
+    def test_cached_data_matches_cleaning(self):
+        path = os.path.join(self.cwd,'poc/quiz/exported_model_files/t7.csv')
+        clean = get_clean_data(path,'A',False,use_cache=False)
+        get_clean_data(path,'A',False)
+        with mock.patch('pandas.read_csv') as read_csv:
+            cached = get_clean_data(path,'A',False)
+        read_csv.assert_not_called()
+        self.assertTrue(cached.equals(clean))
+        self.assertEqual(list(cached.dtypes),list(clean.dtypes))
+
+    def test_changed_export_or_arguments_are_cleaned_again(self):
+        import pandas as pd
+        path = os.path.join(self.directory.name,'export.csv')
+        raw = pd.read_csv(os.path.join(self.cwd,'poc/quiz/exported_model_files/t7.csv'),dtype=str)
+        raw.to_csv(path,index=False)
+        full = get_clean_data(path,'H')
+        balanced = get_clean_data(path,'H',data_balance={program:2 for program in READ_PROGRAMS.values()})
+        self.assertEqual(balanced.program.value_counts().max(),2)
+        raw.head(50).to_csv(path,index=False)
+        self.assertLess(len(get_clean_data(path,'H')),len(full))
+
+    def test_copies_of_the_cleaning_code_never_share_entries(self):
+        path = os.path.join(self.cwd,'poc/quiz/exported_model_files/t7.csv')
+        params = get_cleaning_params('H',True,False)
+        self.assertNotEqual(get_dataset_key('data_load',path,params),get_dataset_key('build_model',path,params))
+
+
+class ModelBundleTests(TestCase):
+    def test_bundle_round_trip_and_checksum(self):
+        loaded = get_loaded_model()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory,'model.bundle')
+            write_bundle(path,loaded.model_name,loaded.columns,loaded.index_dict,loaded.encoded_dict,loaded.kernel,{'accuracy':0.5})
+            bundle = ModelBundle(path)
+            self.assertTrue(np.array_equal(bundle.arrays['params'],loaded.kernel.params))
+            self.assertEqual(bundle.index_dict,loaded.index_dict)
+            self.assertEqual(bundle.encoded_dict,{col:loaded.encoded_dict[col] for col in loaded.columns})
+            self.assertEqual(bundle.metrics,{'accuracy':0.5})
+            del bundle
+
+            with open(path,'r+b') as f:
+                f.seek(-1,os.SEEK_END)
+                last = f.read(1)
+                f.seek(-1,os.SEEK_END)
+                f.write(bytes([last[0]^0xff]))
+            with self.assertRaises(ValueError):
+                ModelBundle(path)
+
+
+class ScoringBackendTests(TestCase):
+    def test_backends_match_sklearn(self):
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.naive_bayes import MultinomialNB
+        from sklearn.tree import DecisionTreeClassifier
+        rng = np.random.RandomState(0)
+        X = rng.randint(0,6,size=(300,12)).astype(float)
+        y = rng.randint(0,15,size=300)
+        estimators = [
+            MultinomialNB(),
+            LogisticRegression(solver='liblinear',multi_class='ovr'),
+            LogisticRegression(solver='lbfgs',multi_class='multinomial',max_iter=1000),
+            DecisionTreeClassifier(random_state=0)
+        ]
+        indices = np.nonzero(X[0])[0]
+        kernels = []
+        for estimator in estimators:
+            estimator.fit(X,y)
+            kernel = kernel_from_model(estimator)
+            kernel = kernel_from_arrays(kernel.backend,kernel.arrays(),kernel.classes_)
+            np.testing.assert_allclose(kernel.predict_proba(X),estimator.predict_proba(X),atol=1e-10)
+            np.testing.assert_allclose(kernel.predict_proba_sparse(indices,X[0][indices]),estimator.predict_proba(X[:1]),atol=1e-10)
+            kernels.append(kernel)
+
+        weights = [0.4,0.3,0.2,0.1]
+        ensemble = EnsembleKernel(kernels,weights,kernels[0].classes_)
+        ensemble = kernel_from_arrays(ensemble.backend,ensemble.arrays(),ensemble.classes_)
+        blended = sum(weight*estimator.predict_proba(X) for weight, estimator in zip(weights,estimators))
+        np.testing.assert_allclose(ensemble.predict_proba(X),blended,atol=1e-10)
+        np.testing.assert_allclose(ensemble.predict_proba_sparse(indices,X[0][indices]),blended[:1],atol=1e-10)
+
+
+def score_by_row(model,test_array,test_actual):
+    # the row by row t3, rr and accuracy evaluate_model replaced, kept to check it scores the same
+    from statistics import mean
+    t3_scores = []
+    rr_scores = []
+    hits = []
+    for i in range(len(test_array)):
+        prediction = model.predict_proba([test_array[i]])
+        p_df = dict(zip(model.classes_.tolist(),np.round(prediction[0],4).tolist()))
+        programs = sorted(p_df,key=p_df.get,reverse=True)
+        rank = programs.index(test_actual[i]) if test_actual[i] in programs else None
+        t3_scores.append(1/(rank+1) if rank is not None and rank < 3 else 0)
+        rr_scores.append(1/(rank+1) if rank is not None else 0)
+        hits.append(int(model.predict([test_array[i]])[0] == test_actual[i]))
+    return mean(t3_scores), mean(rr_scores), mean(hits)
+
+
+class EvaluationTests(TestCase):
+    def test_evaluation_matches_row_by_row_scoring(self):
+        from sklearn.naive_bayes import MultinomialNB
+        rng = np.random.RandomState(0)
+        X = rng.randint(0,3,size=(400,6)).astype(float)
+        y = rng.randint(0,14,size=400)
+        model = MultinomialNB().fit(X,y)
+        # few distinct rows, so rounded probabilities tie; program 14 was never trained on
+        test_array = rng.randint(0,2,size=(150,6)).astype(float)
+        test_actual = rng.randint(0,15,size=150)
+        scores = evaluate_model(model,test_array,test_actual)
+        self.assertEqual((scores['t3'],scores['rr'],scores['accuracy']),score_by_row(model,test_array,test_actual))
+        self.assertEqual(scores['top_1'],scores['accuracy'])
+        self.assertEqual(scores['confusion'].sum(),np.count_nonzero(test_actual != 14))
+        self.assertEqual(np.trace(scores['confusion']),np.count_nonzero(model.predict(test_array) == test_actual))
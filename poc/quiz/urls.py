@@ -6,6 +6,10 @@ from . import views
 urlpatterns = [
     path('', views.quiz, name='quiz'),
     path('recommendations', views.recommendations, name='recommendations'),
+    path('batch', views.batch_submit, name='batchSubmit'),
+    path('api/recommendations', views.recommendations_api, name='recommendationsApi'),
+    path('stats', views.serving_stats, name='servingStats'),
+    path('ready', views.readiness, name='readiness'),
     url(r'submit', views.submit, name='submit'),
     url(r'startQuiz', views.quiz, name='startQuiz'),
     url(r'programInfo', views.programs, name='programInfo'),
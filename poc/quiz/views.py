@@ -1,49 +1,70 @@
 import csv
 from datetime import datetime
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse
 from django.http import HttpResponseRedirect
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_safe
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 from django.urls import reverse
 import json
-import pickle
+import logging
 import numpy as np
-import sys
+import os
 
 from . models import *
 from . data_load import *
 from . activate_model import *
+from . inference import *
+from . result_buffer import *
+from . content import *
+from . page_cache import *
+from . warmup import *
+from . memory_report import *
+from . metrics import *
+from . profiler import *
 
+logger = logging.getLogger(__name__)
+
+@instrument_view('about')
 def about(request):
-    return render(request, 'quiz/about.html')
+    return render_cached_page(request,'about','quiz/about.html')
 
+@instrument_view('home')
 def home(request):
-    return render(request, 'quiz/home.html')
+    return render_cached_page(request,'home','quiz/home.html')
 
+@instrument_view('quiz')
 def quiz(request):
-    return render(request, 'quiz/quiz.html')
+    # the form carries a per-visitor csrf_token, so only the questions are cached
+    context ={
+            'fragment_timeout':settings.PAGE_CACHE_TIMEOUT
+            }
+    return render(request, 'quiz/quiz.html', context)
 
+@instrument_view('programs')
 def programs(request):
-    results = list(sorted(READ_PROGRAMS.keys()))
-    return_list = []
-    for key in results:
-        return_list.append(Recommendation.objects.get(code=READ_PROGRAMS[key]))
+    snapshot = get_content_snapshot()
 
-    comparison_set = Comparison.objects.all()
-    description_set = Description.objects.all()
-    course_set = Course.objects.all()
-    career_set = Career.objects.all()
-    context ={
+    def get_context():
+        results = list(sorted(READ_PROGRAMS.keys()))
+        return_list = []
+        for key in results:
+            return_list.append(snapshot.programs[READ_PROGRAMS[key]])
+        return {
             'recommendation_set':return_list,
-            'comparison_set':list(comparison_set),
-            'course_set':list(course_set),
-            'career_set':list(career_set),
-            'description_set':list(description_set)
+            'content_version':snapshot.cache_version,
+            'fragment_timeout':settings.PAGE_CACHE_TIMEOUT
             }
-    return render(request,'quiz/programs.html',context)
+    return render_cached_page(request,'programs','quiz/programs.html',get_context,snapshot.cache_version)
 
+@instrument_view('email')
 def email(request):
         try:
-                print("Accessed submit...")
+                logger.debug("Accessed email submission...")
                 if request.method == 'POST':
                         if request.POST.get('email'):
                                 email = Email()
@@ -51,174 +72,26 @@ def email(request):
                                 email.save()
                                 return render(request,'quiz/emailSubmission.html')
         except:
-                print("Unexpected error:", sys.exc_info()[0])
+                logger.exception("Unexpected error while saving an email")
         return HttpResponse("Something went wrong...Your email was not submitted")
 
 
+@instrument_view('submit')
 def submit(request):
     try:
-        print("Accessed submit...")
         if request.method == 'POST':
-            print("Post method received")
             post_dict = request.POST
-            print(post_dict)
+            logger.debug("Submission received: %s", post_dict)
             return recommendations(request,post_dict)
     except:
-        print("Unexpected error:", sys.exc_info()[0])
+        logger.exception("Unexpected error while scoring a submission")
+        # the error page is a 200, so instrument_view would not count it
+        ERRORS.labels('submit').inc()
         return HttpResponse("Something went wrong...create) 3")
 
-def recommendations(request,post_dict):
-    model_name = MODEL_NAME
-    post_dict = transform_post_dict(post_dict)
-    print("Entered Response Creation...")
-
-    encoded_dictionary = get_encoded_dict(model_name)
-    print("encoded_dictionary retrieved...")
-
-    # problem_type = encoded_dictionary['problem_type']['problem_type']
-    creative = encoded_dictionary['creative']['creative']
-    outdoors = encoded_dictionary['outdoors']['outdoors']
-    career = encoded_dictionary['career']['career']
-    group_work = encoded_dictionary['group_work']['group_work']
-    liked_courses = encoded_dictionary['liked_courses']['liked_courses']
-    disliked_courses = encoded_dictionary['disliked_courses']['disliked_courses']
-    # programming = encoded_dictionary['programming']['programming']
-    join_clubs = encoded_dictionary['join_clubs']['join_clubs']
-    not_clubs = encoded_dictionary['not_clubs']['not_clubs']
-    liked_projects = encoded_dictionary['liked_projects']['liked_projects']
-    disliked_projects = encoded_dictionary['disliked_projects']['disliked_projects']
-    # tv_shows = encoded_dictionary['tv_shows']['tv_shows']
-    alternate_degree = encoded_dictionary['alternate_degree']['alternate_degree']
-    # expensive_equipment = encoded_dictionary['expensive_equipment']['expensive_equipment']
-    drawing = encoded_dictionary['drawing']['drawing']
-    essay = encoded_dictionary['essay']['essay']
-    architecture = encoded_dictionary['architecture']['architecture']
-    automotive = encoded_dictionary['automotive']['automotive']
-    business = encoded_dictionary['business']['business']
-    construction = encoded_dictionary['construction']['construction']
-    health = encoded_dictionary['health']['health']
-    environment = encoded_dictionary['environment']['environment']
-    manufacturing = encoded_dictionary['manufacturing']['manufacturing']
-    technology = encoded_dictionary['technology']['technology']
-
-    print("Labels encoded..")
-
-	# Prepare the feature vector for prediction
-
-    print("Loading new_vector....")
-    pkl_file = open('poc/quiz/exported_model_files/'+model_name+'_cat', 'rb')
-    index_dict = pickle.load(pkl_file)
-    new_vector = np.zeros(21)
-
-    print("Loading response into new_vector...")
-
-    # new_vector[0] =  0 #problem_type[post_dict['problem_type'][0]]
-    new_vector[0] =  creative[post_dict['creative'][0]]
-    new_vector[1] =  outdoors[post_dict['outdoors'][0]]
-    new_vector[2] =  career[post_dict['career'][0]]
-    new_vector[3] =  group_work[post_dict['group_work'][0]]
-    new_vector[4] =  liked_courses[post_dict['liked_courses'][0]]
-    new_vector[5] =  disliked_courses[post_dict['disliked_courses'][0]]
-    # new_vector[7] =  0 #programming[post_dict['programming'][0]]
-    new_vector[6] =  join_clubs[post_dict['join_clubs'][0]]
-    new_vector[7] =  not_clubs[post_dict['not_clubs'][0]]
-    new_vector[8] = liked_projects[post_dict['liked_projects'][0]]
-    new_vector[9] = disliked_projects[post_dict['disliked_projects'][0]]
-    # new_vector[12] = 0 #tv_shows[post_dict['tv_shows'][0]]
-    new_vector[10] = alternate_degree[post_dict['alternate_degree'][0]]
-    # new_vector[14] = 0 #expensive_equipment[post_dict['expensive_equipment'][0]]
-    new_vector[11] = drawing[post_dict['drawing'][0]]
-    new_vector[12] = essay[post_dict['essay'][0]]
-    new_vector[13] = architecture[post_dict['architecture'][0]]
-    new_vector[14] = automotive[post_dict['automotive'][0]]
-    new_vector[15] = business[post_dict['business'][0]]
-    new_vector[16] = construction[post_dict['construction'][0]]
-    new_vector[17] = health[post_dict['health'][0]]
-    new_vector[18] = environment[post_dict['environment'][0]]
-    new_vector[19] = manufacturing[post_dict['manufacturing'][0]]
-    new_vector[20] = technology[post_dict['technology'][0]]
-
-    if 'ohe' in model_name:
-        print("entered ohe model handling")
-        new_vector = list(new_vector)
-        for i in range(len(new_vector)):
-            new_vector[i]  = str(int(new_vector[i]))
-        columns = [
-                    'creative',
-                    'outdoors',
-                    'career',
-                    'group_work',
-                    'liked_courses',
-                    'disliked_courses',
-                    'join_clubs',
-                    'not_clubs',
-                    'liked_projects',
-                    'disliked_projects',
-                    'alternate_degree',
-                    'drawing',
-                    'essay',
-                    'architecture',
-                    'automotive',
-                    'business',
-                    'construction',
-                    'health',
-                    'environment',
-                    'manufacturing',
-                    'technology'
-        ]
-        t7 = get_label_encoded_data('poc/quiz/exported_model_files/t7.csv',model_name='t7',column_list=columns,drop_not_happy='H',data_balance=False)[0]
-        data_to_append = {}
-        for i in range(len(columns)):
-            data_to_append[t7.columns[i]] = int(new_vector[i])
-        t7 = t7.append(data_to_append, ignore_index = True)
-        t7 = pd.get_dummies(t7,columns=columns)
-        rename_columns = {
-            'architecture_1':'architecture',
-            'automotive_1':'automotive',
-            'business_1':'business',
-            'construction_1':'construction',
-            'health_1':'health',
-            'environment_1':'environment',
-            'manufacturing_1':'manufacturing',
-            'technology_1':'technology'
-        }
-        drop_columns = [
-            'architecture_0',
-            'automotive_0',
-            'business_0',
-            'construction_0',
-            'health_0',
-            'environment_0',
-            'manufacturing_0',
-            'technology_0'
-        ]
-        t7 = t7.rename(index=str,columns = rename_columns)
-        t7 = t7.drop(drop_columns, axis=1)
-        new_vector = np.array(t7[len(t7)-1:len(t7)])
-
-    print("Loading model...")
-    print(MODEL_NAME)
-    pkl_file = open('poc/quiz/exported_model_files/'+model_name+'.pkl', 'rb')
-    model = pickle.load(pkl_file)
-    try:
-        prediction = model.predict_proba([new_vector])
-    except:
-        prediction = model.predict_proba(new_vector)
-    print("Prediction created...")
-
-    # Getting Ordered Results
-    results_dict = retrieve_prediction_labels(model,prediction)
-    results = list(sorted(results_dict, key=lambda key: results_dict[key],reverse=True))
-    return_list = []
-    for key in results:
-        return_list.append(Recommendation.objects.get(code=key))
-
-    print("Weights of Results")
-    print(results_dict)
-    print("Response Created...")
-
-    print("Creating new record...")
+def build_result(post_dict,results_dict,model_name=MODEL_NAME):
     new_record = Result()
+    new_record.model_name = model_name
     new_record.time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     # new_record.problem_type = post_dict['problem_type']
     new_record.creative = post_dict['creative']
@@ -261,20 +134,170 @@ def recommendations(request,post_dict):
     new_record.syde = results_dict['swe']
     new_record.swe = results_dict['syde']
     new_record.tron = results_dict['tron']
-    print("new record information collected...")
+    return new_record
 
-    new_record.save()
-    print("new record saved...")
+def recommendations(request,post_dict):
+    with time_stage('transform'):
+        post_dict = transform_post_dict(post_dict)
 
-    comparison_set = Comparison.objects.all()
-    description_set = Description.objects.all()
-    course_set = Course.objects.all()
-    career_set = Career.objects.all()
-    context ={
-            'recommendation_set':return_list,
-            'comparison_set':list(comparison_set),
-            'course_set':list(course_set),
-            'career_set':list(career_set),
-            'description_set':list(description_set)
-            }
-    return render(request,'quiz/recommendations.html',context)
+    model_name, results_dict, results = get_routed_prediction(post_dict)
+    logger.debug("Scored with %s: %s", model_name, results_dict)
+
+    with time_stage('db_write'):
+        new_record = build_result(post_dict,results_dict,model_name)
+        RESULT_BUFFER.add(new_record)
+
+    with time_stage('context'):
+        # Getting Ordered Results
+        snapshot = get_content_snapshot()
+        return_list = []
+        for key in results:
+            return_list.append(snapshot.programs[key])
+        context ={
+                'recommendation_set':return_list,
+                'content_version':snapshot.cache_version,
+                'fragment_timeout':settings.PAGE_CACHE_TIMEOUT
+                }
+    with time_stage('render'):
+        return render(request,'quiz/recommendations.html',context)
+
+def normalize_json_response(response):
+    # JSON answers may be plain strings, the form posts every answer as a list
+    post_dict = {}
+    for key, value in response.items():
+        if not isinstance(value,list):
+            value = [value]
+        if not all(isinstance(answer,str) for answer in value):
+            raise TypeError("answer to "+str(key)+" must be a string or a list of strings")
+        post_dict[key] = value
+    return transform_post_dict(post_dict)
+
+@csrf_exempt
+@require_POST
+@instrument_view('batch')
+def batch_submit(request):
+    # writes a Result per response, so only callers holding BATCH_SCORING_TOKEN may use it
+    token = settings.BATCH_SCORING_TOKEN
+    if not token or request.META.get('HTTP_AUTHORIZATION','') != 'Bearer '+token:
+        return JsonResponse({'error':'A valid BATCH_SCORING_TOKEN bearer token is required'},status=403)
+    try:
+        body = json.loads(request.body.decode('utf-8'))
+        responses = body['responses'] if isinstance(body,dict) else body
+        if not isinstance(responses,list):
+            raise ValueError("responses must be a list")
+    except (ValueError,KeyError,TypeError) as e:
+        return JsonResponse({'error':'Expected a JSON body of the form {"responses": [...]}: '+str(e)},status=400)
+    if len(responses) > settings.BATCH_SCORING_MAX_RESPONSES:
+        return JsonResponse({'error':'At most '+str(settings.BATCH_SCORING_MAX_RESPONSES)+' responses per batch'},status=400)
+
+    post_dicts = []
+    with time_stage('transform'):
+        for i in range(len(responses)):
+            try:
+                post_dicts.append(normalize_json_response(responses[i]))
+            except (KeyError,AttributeError,TypeError) as e:
+                return JsonResponse({'error':'Response '+str(i)+' has a missing or malformed answer: '+str(e)},status=400)
+    try:
+        predictions = get_batch_predictions(post_dicts,MODEL_NAME)
+    except (KeyError,IndexError) as e:
+        return JsonResponse({'error':'Unknown or missing answer: '+str(e)},status=400)
+
+    new_records = []
+    scored = []
+    with time_stage('context'):
+        for post_dict, (results_dict, results) in zip(post_dicts,predictions):
+            new_records.append(build_result(post_dict,results_dict,MODEL_NAME))
+            scored.append({
+                'programs':results,
+                'scores':[results_dict[code] for code in results]
+            })
+    with time_stage('db_write'):
+        Result.objects.bulk_create(new_records)
+    logger.info("Batch of %d responses scored", len(new_records))
+    with time_stage('render'):
+        return JsonResponse({'model':MODEL_NAME,'results':scored})
+
+@require_safe
+@instrument_view('api')
+def recommendations_api(request):
+    # same answers as the quiz form, passed as query parameters so the CDN can cache by URL
+    try:
+        with time_stage('transform'):
+            post_dict = transform_post_dict(request.GET)
+        model_name, key = get_routed_prediction_key(post_dict)
+    except KeyError as e:
+        return JsonResponse({'error':'Missing answer: '+str(e)},status=400)
+    etag = '"'+key+'"'
+
+    response = get_conditional_response(request,etag=etag)
+    if response is None:
+        try:
+            served_model, results_dict, results = get_routed_prediction(post_dict,model_name)
+        except KeyError as e:
+            return JsonResponse({'error':'Unknown answer: '+str(e)},status=400)
+        if served_model != model_name:
+            # the candidate failed while scoring, the body is the primary's and so must be the ETag
+            model_name = served_model
+            etag = '"'+get_prediction_key(post_dict,model_name)+'"'
+        with time_stage('render'):
+            response = JsonResponse({
+                'model':model_name,
+                'programs':results,
+                'scores':[results_dict[code] for code in results]
+            },json_dumps_params={'separators':(',',':')})
+    response['ETag'] = etag
+    patch_cache_control(response,public=True,max_age=settings.RECOMMENDATIONS_API_MAX_AGE)
+    return response
+
+@staff_member_required
+def serving_stats(request):
+    return JsonResponse({
+        'model':MODEL_NAME,
+        'prediction_cache':PREDICTION_CACHE.stats(),
+        'models':MODEL_ROUTER.stats(),
+        'result_buffer':RESULT_BUFFER.stats(),
+        'memory':get_memory_report()
+    })
+
+@require_safe
+def readiness(request):
+    # 503 until the active model has been loaded and scored once in this worker
+    status = 200 if WARMUP_STATE.ready else 503
+    return JsonResponse(WARMUP_STATE.as_dict(),status=status)
+
+@require_safe
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if token and request.META.get('HTTP_AUTHORIZATION','') != 'Bearer '+token:
+        return HttpResponse(status=403)
+    body, content_type = render_metrics()
+    return HttpResponse(body,content_type=content_type)
+
+@staff_member_required
+def profile_captures(request):
+    captures = []
+    for name in PROFILE_STORE.list():
+        try:
+            summary = PROFILE_STORE.read_summary(name)
+        except (OSError,ValueError):
+            continue
+        captures.append({
+            'name':name,
+            'path':summary['path'],
+            'status':summary['status'],
+            'seconds':summary['seconds'],
+            'time':summary['time'],
+            'sql_queries':summary['sql']['count'],
+            'sql_seconds':summary['sql']['seconds'],
+            'allocated_bytes':summary['allocated_bytes'],
+            'profile':reverse('profileCapture',args=[name,'prof']),
+            'summary':reverse('profileCapture',args=[name,'json'])
+        })
+    return JsonResponse({'captures':captures})
+
+@staff_member_required
+def profile_capture(request,name,kind):
+    path = PROFILE_STORE.get_path(name,'.'+kind)
+    if not os.path.exists(path):
+        raise Http404("No such capture")
+    return FileResponse(open(path,'rb'),as_attachment=True,filename=name+'.'+kind)
@@ -0,0 +1,57 @@
+import logging
+import sys
+import time
+
+from . activate_model import *
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    '''
+    What the readiness probe reports: whether the active model has been loaded
+    and scored once in this process, and how long importing the serving
+    modules and warming the model took.
+    '''
+    def __init__(self):
+        self.ready = False
+        self.model_name = None
+        self.import_seconds = None
+        self.warmup_seconds = None
+        self.error = None
+
+    def as_dict(self):
+        return {
+            'ready':self.ready,
+            'model':self.model_name,
+            'import_seconds':self.import_seconds,
+            'warmup_seconds':self.warmup_seconds,
+            'error':self.error,
+            'heavy_modules_loaded':[name for name in ('pandas','sklearn','matplotlib') if name in sys.modules]
+        }
+
+
+WARMUP_STATE = WarmupState()
+
+def get_dummy_answers(loaded_model):
+    # the first known answer to every question, enough to run the whole scoring path once
+    encoder = loaded_model.encoder
+    return {col:[next(iter(encoder.lookup[col]))] for col in encoder.columns}
+
+def warm_up_model(model_name=MODEL_NAME):
+    from . model_registry import get_loaded_model
+    start = time.monotonic()
+    WARMUP_STATE.model_name = model_name
+    try:
+        loaded_model = get_loaded_model(model_name)
+        features = loaded_model.encoder.encode(get_dummy_answers(loaded_model))
+        loaded_model.kernel.predict_proba(features)
+    except Exception as e:
+        WARMUP_STATE.error = str(e)
+        logger.error("Model warm-up failed for %s: %s", model_name, e)
+        return False
+    WARMUP_STATE.warmup_seconds = round(time.monotonic() - start,4)
+    WARMUP_STATE.error = None
+    WARMUP_STATE.ready = True
+    logger.info("Model %s warmed up in %ss", model_name, WARMUP_STATE.warmup_seconds)
+    return True
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'poc.quiz.profiler.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'poc.urls'
@@ -93,6 +94,9 @@ if len(DATABASES['default']) == 0:
           }
       }
 
+# Migrations are generated on the dyno (see commands.txt), so tests build their database from the models
+TEST_RUNNER = 'poc.test_runner.QuizTestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -135,6 +139,83 @@ STATIC_URL = '/static/'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Extra places for collectstatic to find static files.
 
+# Model serving
+# Load the active model and score one dummy response when the app starts, before the worker takes traffic
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', 'True') == 'True'
+# Number of scored answer combinations kept per worker, and for how many seconds (None = until evicted)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = None
+if os.environ.get('PREDICTION_CACHE_TTL'):
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL'))
+# Most frequent stored responses scored into the cache when a worker starts (0 disables)
+PREDICTION_CACHE_PREWARM = int(os.environ.get('PREDICTION_CACHE_PREWARM', 0))
+# Largest number of responses accepted by one request to the batch scoring endpoint
+BATCH_SCORING_MAX_RESPONSES = int(os.environ.get('BATCH_SCORING_MAX_RESPONSES', 1000))
+# Bearer token the batch scoring endpoint requires, the endpoint is closed while it is unset
+BATCH_SCORING_TOKEN = os.environ.get('BATCH_SCORING_TOKEN', '')
+# Seconds browsers and the CDN may reuse a response of the JSON recommendations API
+RECOMMENDATIONS_API_MAX_AGE = int(os.environ.get('RECOMMENDATIONS_API_MAX_AGE', 3600))
+# Result rows are queued and written in bulk off the request path, rows that cannot be written go to the spill file
+RESULT_BUFFER_WRITE_BEHIND = os.environ.get('RESULT_BUFFER_WRITE_BEHIND', 'True') == 'True'
+RESULT_BUFFER_MAX_QUEUE = int(os.environ.get('RESULT_BUFFER_MAX_QUEUE', 10000))
+RESULT_BUFFER_BATCH_SIZE = int(os.environ.get('RESULT_BUFFER_BATCH_SIZE', 50))
+RESULT_BUFFER_FLUSH_INTERVAL = float(os.environ.get('RESULT_BUFFER_FLUSH_INTERVAL', 2.0))
+RESULT_BUFFER_SPILL_PATH = os.environ.get('RESULT_BUFFER_SPILL_PATH', os.path.join(BASE_DIR, 'result_spill.jsonl'))
+# Program content is read once per worker and rebuilt when the content version in the cache changes.
+# The version is checked at most every CONTENT_VERSION_CHECK_INTERVAL seconds, and a snapshot is never
+# kept longer than CONTENT_SNAPSHOT_MAX_AGE seconds (workers only share the version with a shared cache backend)
+CONTENT_VERSION_CHECK_INTERVAL = float(os.environ.get('CONTENT_VERSION_CHECK_INTERVAL', 1.0))
+CONTENT_SNAPSHOT_MAX_AGE = float(os.environ.get('CONTENT_SNAPSHOT_MAX_AGE', 300))
+# Rendered home, about and programs pages and the program fragments are kept in the cache for
+# PAGE_CACHE_TIMEOUT seconds (keyed on the worker's content snapshot, so they are re-rendered at least every
+# CONTENT_SNAPSHOT_MAX_AGE seconds), browsers and the CDN revalidate after PAGE_CACHE_MAX_AGE
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 86400))
+PAGE_CACHE_MAX_AGE = int(os.environ.get('PAGE_CACHE_MAX_AGE', 60))
+# Only bearer requests with this token may read /metrics when it is set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# Requests from staff users carrying PROFILER_HEADER, and PROFILER_SAMPLE_RATE of the requests to PROFILER_VIEWS,
+# are profiled (cProfile, tracemalloc, SQL). The last PROFILER_MAX_CAPTURES are kept and listed at admin/profiles/
+PROFILER_HEADER = os.environ.get('PROFILER_HEADER', 'X-Profile')
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+PROFILER_VIEWS = ['submit', 'programs', 'programInfo']
+PROFILER_MAX_CAPTURES = int(os.environ.get('PROFILER_MAX_CAPTURES', 50))
+PROFILER_TRACEMALLOC_FRAMES = int(os.environ.get('PROFILER_TRACEMALLOC_FRAMES', 1))
+PROFILER_DIR = os.environ.get('PROFILER_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Logging
+# Warnings and errors are always written, debug and info lines only for LOG_SAMPLE_RATE of the requests
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.05))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_sample': {
+            '()': 'poc.quiz.metrics.RequestSampleFilter',
+        },
+    },
+    'formatters': {
+        'simple': {
+            'format': '%(asctime)s [%(process)d] [%(levelname)s] %(name)s %(message)s',
+            'datefmt': '%Y-%m-%d %H:%M:%S',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_sample'],
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'poc': {
+            'handlers': ['console'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
 import django_heroku
-django_heroku.settings(locals())
+django_heroku.settings(locals(), logging=False)
 # del DATABASES['default']['OPTIONS']['sslmode']
@@ -0,0 +1,17 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class QuizTestRunner(DiscoverRunner):
+    '''
+    The quiz app's migrations are generated on the dyno and not kept in the
+    repository, so the test database is created straight from its models.
+    '''
+    def setup_test_environment(self,**kwargs):
+        super().setup_test_environment(**kwargs)
+        self.migration_modules = override_settings(MIGRATION_MODULES={'quiz': None})
+        self.migration_modules.enable()
+
+    def teardown_test_environment(self,**kwargs):
+        self.migration_modules.disable()
+        super().teardown_test_environment(**kwargs)
@@ -14,12 +14,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from . quiz import views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('programs', views.programs, name='programs'),
+    path('metrics', views.metrics, name='metrics'),
     path('quiz/', include('poc.quiz.urls')),
+    path('admin/profiles/', views.profile_captures, name='profileCaptures'),
+    re_path(r'^admin/profiles/(?P<name>[0-9_]+)\.(?P<kind>prof|json)$', views.profile_capture, name='profileCapture'),
     path('admin/', admin.site.urls),
 ]
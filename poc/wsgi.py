@@ -6,6 +6,7 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 For more information on this file, see
 https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
 """
+import logging
 import os
 from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "poc.settings")
@@ -13,4 +14,13 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "poc.settings")
 from dj_static import Cling
 application = Cling(get_wsgi_application())
 
+from django.conf import settings
+if settings.PREDICTION_CACHE_PREWARM > 0:
+    try:
+        from poc.quiz.inference import prewarm_prediction_cache
+        prewarm_prediction_cache(settings.PREDICTION_CACHE_PREWARM)
+    except Exception as e:
+        # a cold cache is not a reason to keep the worker from starting
+        logging.getLogger(__name__).warning("Prediction cache pre-warm failed: %s", e)
+
 # application = get_wsgi_application()